@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import os
+
+from utils.embedding import local_embed_queries, local_embed_passages
+from utils.embedding_service import MicroBatcher, encode_message, parse_address, read_message, to_wire
+from utils.env import env
+
+# Shared embedding server, e.g.:
+# python embedding_server.py --address /tmp/embedding.sock --max-batch-size 64 --max-wait-ms 5
+# with EMBEDDING_SERVER=/tmp/embedding.sock in .env. API and ingestion workers on the host then send their
+# embedding requests here instead of loading the models themselves, so there is one copy of the models per
+# host, and concurrent requests from all workers are micro-batched into larger, more efficient model calls.
+# The cross-encoder re-ranker is not served here and still loads in the processes that use it.
+
+def embed_query_texts(texts: list[str]) -> list[dict]:
+    return [to_wire(sparse, dense) for sparse, dense in local_embed_queries(texts)]
+
+def embed_passage_texts(texts: list[str]) -> list[dict]:
+    return [to_wire(embedding["bm42"], embedding["jina"]) for embedding in local_embed_passages(texts, batch_size=len(texts))]
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, batchers: dict[str, MicroBatcher]) -> None:
+    # Requests on one connection are answered as they complete, so a client may pipeline them
+    write_lock = asyncio.Lock()
+    tasks = set()
+
+    async def respond(message: dict) -> None:
+        op = message.get("op")
+        try:
+            if op == "stats":
+                response = {"stats": {name: batcher.stats() for name, batcher in batchers.items()}}
+            elif op in batchers:
+                response = {"embeddings": await batchers[op].submit(message["texts"])}
+            else:
+                response = {"error": f"Unknown op {op!r}"}
+        except Exception as e:
+            response = {"error": str(e)}
+        async with write_lock:
+            writer.write(encode_message(response | {"id": message.get("id")}))
+            await writer.drain()
+
+    try:
+        while True:
+            task = asyncio.create_task(respond(await read_message(reader)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(address: str, max_batch_size: int, max_wait: float) -> None:
+    # Load the models before accepting connections
+    await asyncio.to_thread(local_embed_queries, ["warm up"])
+
+    batchers = {
+        "query": MicroBatcher(embed_query_texts, max_batch_size, max_wait),
+        "passage": MicroBatcher(embed_passage_texts, max_batch_size, max_wait),
+    }
+    runners = [asyncio.create_task(batcher.run()) for batcher in batchers.values()]
+
+    async def handler(reader, writer):
+        await handle_connection(reader, writer, batchers)
+
+    parsed = parse_address(address)
+    if isinstance(parsed, tuple):
+        server = await asyncio.start_server(handler, *parsed)
+    else:
+        if os.path.exists(parsed):
+            os.unlink(parsed)
+        server = await asyncio.start_unix_server(handler, parsed)
+    print(f"Embedding server listening on {address}")
+    async with server:
+        await server.serve_forever()
+    for runner in runners:
+        runner.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve BM42 and Jina embeddings to every worker on the host")
+    parser.add_argument("--address", default=env.get("EMBEDDING_SERVER") or "embedding.sock", help="Unix socket path or host:port")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Most texts per model call")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="Longest a request waits for its batch to fill")
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.address, args.max_batch_size, args.max_wait_ms / 1000))
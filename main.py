@@ -1,9 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from resolvers import auth, register, user, business
+from utils import embedding
+from utils.auth import user_cache
+from utils.env import env
+from utils.ingest_queue import ingest_queue
+from utils.metrics import registry
+from utils.rating_cache import rating_cache
+from utils.request_context import RequestContextMiddleware
+from utils.tracing import configure_logging
+from utils.vector_db import get_async_vector_client
 
-app = FastAPI()
+configure_logging()
+
+registry.register_gauges("rating_cache", rating_cache.stats)
+registry.register_gauges("user_cache", user_cache.stats)
+registry.register_gauges("ingest_queue", lambda: {"pending": ingest_queue.pending_count()})
+
+def warm_up() -> None:
+    embedding.warm_up()
+    get_async_vector_client()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models and clients load on first use. WARM_UP=1 loads them at startup instead, so the first match
+    # request doesn't pay for it; leave it off for workers that only serve auth and job endpoints.
+    if env.get("WARM_UP") in ("1", "true"):
+        await asyncio.to_thread(warm_up)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +42,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestContextMiddleware)
 
 app.include_router(auth.router)
 app.include_router(register.router)
@@ -22,3 +53,8 @@ app.include_router(business.router, prefix="/business")
 async def root():
     return {"message": "Hello World"}
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text format, for this process only
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal, Optional
 import json
 
@@ -27,6 +27,40 @@ class UserInDB(User):
     def to_public_user(self) -> User:
         return User(**self.model_dump())
     
+class CandidateFilters(BaseModel):
+    # Conditions every retrieved candidate must meet, applied inside the vector search.
+    # Candidates whose payload lacks a filtered field (e.g. resumes ingested before it existed) are excluded.
+    cities: Optional[list[str]] = None
+    countries: Optional[list[str]] = None
+    # Candidates must have every one of these skills (names from utils.resume_fields.SKILLS)
+    skills: Optional[list[str]] = None
+    min_years_experience: Optional[float] = Field(default=None, ge=0)
+    uploaded_within_days: Optional[float] = Field(default=None, gt=0)
+
+class MatchingConfig(BaseModel):
+    # Depth of each matching stage:
+    # 1. prefetch_limit candidates from each of the BM42 and Jina indexes, fused with RRF into rerank_limit candidates
+    # 2. a local re-ranker orders those candidates ("none" keeps the fusion order)
+    # 3. the top rating_limit candidates are rated by the LLM, rating_batch_size resumes per call
+    prefetch_limit: int = Field(default=10, ge=1, le=1000)
+    rerank_limit: int = Field(default=10, ge=1, le=1000)
+    rating_limit: int = Field(default=10, ge=1, le=200)
+    rating_batch_size: int = Field(default=1, ge=1, le=20)
+    reranker: Literal["none", "weighted", "cross_encoder"] = "none"
+    # Share of the dense (Jina) similarity in the "weighted" re-ranker; the rest goes to BM42
+    dense_weight: float = Field(default=0.5, ge=0, le=1)
+    filters: Optional[CandidateFilters] = None
+    # Search-time settings of the Jina HNSW search (see testing/create_qdrant_collection.py):
+    # hnsw_ef trades speed for recall (None uses the collection's default), and on quantized collections
+    # quantization_oversampling fetches that many times prefetch_limit candidates by their quantized vectors,
+    # which quantization_rescore then re-scores with the original vectors
+    hnsw_ef: Optional[int] = Field(default=None, ge=1, le=4096)
+    quantization_oversampling: Optional[float] = Field(default=None, ge=1, le=16)
+    quantization_rescore: bool = True
+    # "chunk" retrieves section chunks (see utils/chunking.py) and ranks each candidate by their best chunk,
+    # so long resumes are fully searchable. The chunk collection must be populated (RESUME_CHUNKS=1).
+    retrieval_unit: Literal["resume", "chunk"] = "resume"
+
 class Job(BaseModel):
     user_id: str
     job_desc: str
@@ -34,6 +68,7 @@ class Job(BaseModel):
     rating_schema_weights: Optional[dict[str, float]] = None
     job_id: str
     job_title: str
+    matching_config: Optional[MatchingConfig] = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -41,10 +76,11 @@ class Job(BaseModel):
             self.rating_schema_weights = {key: 1.0 for key in self.rating_schema["properties"].keys()}
 
     @classmethod
-    def init_job(cls, rating_schema: str | dict, rating_schema_weights: str | dict, **kwargs) -> 'Job':
+    def init_job(cls, rating_schema: str | dict, rating_schema_weights: str | dict, matching_config: str | dict | None = None, **kwargs) -> 'Job':
         return Job(
             rating_schema=json.loads(rating_schema) if isinstance(rating_schema, str) else rating_schema,
             rating_schema_weights=json.loads(rating_schema_weights) if isinstance(rating_schema_weights, str) else rating_schema_weights,
+            matching_config=json.loads(matching_config) if isinstance(matching_config, str) else matching_config,
             **kwargs
         )
     
@@ -54,6 +90,11 @@ class CandidateMatch(BaseModel):
     score: float
     name: str
     ratings: dict[str, float]
+    candidate_id: Optional[str] = None
+    # Refresh that wrote this row, see utils.match_store
+    generation: Optional[int] = None
+    # Version of the resume the ratings were made from, see utils.resume_index
+    resume_version: Optional[int] = None
 
     def __lt__(self, other: 'CandidateMatch') -> bool:
         return self.score < other.score
@@ -66,5 +107,14 @@ class CandidateMatch(BaseModel):
     
     def __le__(self, other: 'CandidateMatch') -> bool:
         return self.score <= other.score
-    
-    
\ No newline at end of file
+
+class IngestJob(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "done", "failed"]
+    stage: Optional[str] = None
+    timings: dict[str, float]
+    error: Optional[str] = None
+    attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
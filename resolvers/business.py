@@ -1,14 +1,18 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from typing import Annotated, List, Optional
 from fastapi import Depends
 from utils.auth import get_current_user, supabase
 from utils.agents import SchemaMakerAgent
-from models import User, Job, CandidateMatch
+from models import User, Job, CandidateMatch, MatchingConfig
 from uuid import uuid4
+import asyncio
 import json
 
-from utils.matching import calculate_resume_matches
+from utils.timing import timed, server_timing_header
+from utils.match_store import match_repository
+from utils.matching import calculate_resume_matches, calculate_batch_matches, retrieve_resumes, iter_rated_resumes, make_resume_rater, score_candidates, build_query_embedding, is_query_embedding_fresh
 
 router = APIRouter()
 
@@ -18,19 +22,26 @@ class JobRequest(BaseModel):
     job_desc: str
     job_title: str
 
+class BatchMatchRequest(BaseModel):
+    job_ids: List[str]
+
 class EditJobRequest(BaseModel):
     job_id: str
     job_title: Optional[str] = None
     job_desc: Optional[str] = None
     rating_schema: Optional[str] = None
     rating_schema_weights: Optional[str] = None
+    matching_config: Optional[str] = None
 
 @router.post("/create_job", response_model=Job)
 async def create_job(current_user: Annotated[User, Depends(get_current_user)], job: JobRequest):
-    schema = schema_maker.respond(job.job_desc)
+    # Few-shot history, if enabled, only ever comes from the same user's earlier jobs
+    schema = await schema_maker.respond(job.job_desc, history_key=current_user.uuid)
     json_schema = json.loads(schema)
     job = Job(user_id=current_user.uuid, job_desc=job.job_desc, job_title=job.job_title, job_id=str(uuid4()), rating_schema=json_schema)
-    supabase.table("jobs").insert(job.model_dump()).execute()
+    # Query embeddings only depend on the rating schema, so compute them once here instead of on every match
+    query_embedding = await asyncio.to_thread(build_query_embedding, json_schema)
+    supabase.table("jobs").insert(job.model_dump() | {"query_embedding": query_embedding}).execute()
     return job
 
 @router.get("/get_jobs", response_model=List[Job])
@@ -48,7 +59,8 @@ async def edit_job(current_user: Annotated[User, Depends(get_current_user)], edi
     job_desc = edit_job_request.job_desc
     rating_schema = edit_job_request.rating_schema
     rating_schema_weights = edit_job_request.rating_schema_weights
-    if all([not job_title, not job_desc, not rating_schema, not rating_schema_weights]):
+    matching_config = edit_job_request.matching_config
+    if all([not job_title, not job_desc, not rating_schema, not rating_schema_weights, not matching_config]):
         raise HTTPException(status_code=400, detail="No fields to update")
     update_dict = {}
     json_weights = None
@@ -63,12 +75,19 @@ async def edit_job(current_user: Annotated[User, Depends(get_current_user)], edi
         except Exception as e:
             raise HTTPException(status_code=400, detail="Invalid rating schema. Please ensure it is a valid JSON object.")
         update_dict["rating_schema"] = rating_schema
+        update_dict["query_embedding"] = await asyncio.to_thread(build_query_embedding, json_schema)
     if rating_schema_weights:
         try:
             json_weights = json.loads(rating_schema_weights)
         except Exception as e:
             raise HTTPException(status_code=400, detail="Invalid rating schema weights. Please ensure it is a valid JSON object.")
         update_dict["rating_schema_weights"] = rating_schema_weights
+    if matching_config:
+        try:
+            MatchingConfig.model_validate_json(matching_config)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid matching config: {e}")
+        update_dict["matching_config"] = matching_config
     try:
         job = supabase.table("jobs").update(update_dict).eq("job_id", edit_job_request.job_id).execute().data[0]
     except Exception as e:
@@ -82,44 +101,172 @@ async def edit_job(current_user: Annotated[User, Depends(get_current_user)], edi
         
     return Job.init_job(**job)
 
-@router.get("/calculate_matches", response_model=List[CandidateMatch])
-async def calculate_matches(current_user: Annotated[User, Depends(get_current_user)], job_id: str):
-    
+async def load_matching_job(job_id: str, timings: dict[str, float] | None = None) -> tuple[Job, dict]:
     # Get job data
-    job = supabase.table("jobs").select("*").eq("job_id", job_id).execute().data[0]
-    print(f"JOB: {job}")
-    schema = job["rating_schema"]
-    schema_weights = job["rating_schema_weights"]
-
-    if isinstance(schema, str):
-        schema_dict = json.loads(schema)
-    else:
-        schema_dict = schema
-
-    if isinstance(schema_weights, str):
-        schema_weights_dict = json.loads(schema_weights)
-    else:
-        schema_weights_dict = schema_weights
+    with timed(timings, "load_job", job_id=job_id):
+        job_row = supabase.table("jobs").select("*").eq("job_id", job_id).execute().data[0]
+    job = Job.init_job(**job_row)
+    schema_dict = job.rating_schema
+    schema_weights_dict = job.rating_schema_weights
 
     # Check if schema and schema weights match
     if schema_dict["properties"].keys() != schema_weights_dict.keys():
         raise HTTPException(status_code=400, detail=f"Schema categories and weight categories do not match. Schema: {schema_dict.keys()}, Schema Weights: {schema_weights_dict.keys()}")
     
-    # Calculate matches
-    matches = calculate_resume_matches(schema_dict, schema_weights_dict)
+    # Refresh the stored query embeddings if they are missing or were computed for an older schema
+    query_embedding = job_row.get("query_embedding")
+    if isinstance(query_embedding, str):
+        query_embedding = json.loads(query_embedding)
+    if not is_query_embedding_fresh(query_embedding, schema_dict):
+        with timed(timings, "refresh_query_embedding", job_id=job_id):
+            query_embedding = await asyncio.to_thread(build_query_embedding, schema_dict)
+            supabase.table("jobs").update({"query_embedding": query_embedding}).eq("job_id", job_id).execute()
+
+    return job, query_embedding
+
+@router.get("/calculate_matches", response_model=List[CandidateMatch])
+async def calculate_matches(current_user: Annotated[User, Depends(get_current_user)], job_id: str, response: Response):
+    # Calculate matches, recording the time spent in each stage
+    timings = {}
+    job, query_embedding = await load_matching_job(job_id, timings)
+
+    failed = set()
+    matches = await calculate_resume_matches(job.rating_schema, job.rating_schema_weights, query_embedding=query_embedding, config=job.matching_config, rerank_query=job.job_desc, timings=timings, failed=failed)
+    # With every rating failed (e.g. the LLM API is down), keep the stored ranking rather than replacing it with nothing
+    if failed and not matches:
+        raise HTTPException(status_code=502, detail="Rating candidates failed, please try again later")
     
     # Sort matches
-    sorted_matches = sorted([CandidateMatch(**match, job_id=job_id) for match in matches], reverse=True)
+    sorted_matches = sorted([CandidateMatch(**match, job_id=job_id, candidate_id=str(match["id"])) for match in matches], reverse=True)
     
-    # Remove all matches for this job from the database
-    supabase.table("matches").delete().eq("job_id", job_id).execute()
-    
-    # Insert matches into database
-    supabase.table("matches").insert([match.model_dump() for match in sorted_matches]).execute()
+    # Upsert the new ranking, then drop the rows it replaced, except those of candidates whose rating failed
+    with timed(timings, "save_matches", matches=len(sorted_matches)):
+        match_repository.replace_matches([job_id], sorted_matches, keep={job_id: failed})
+    response.headers["Server-Timing"] = server_timing_header(timings)
+
+    return sorted_matches
+
+@router.post("/calculate_matches_batch", response_model=dict[str, List[CandidateMatch]])
+async def calculate_matches_batch(current_user: Annotated[User, Depends(get_current_user)], batch_request: BatchMatchRequest, response: Response):
+    # Refresh many jobs at once, sharing embedding, retrieval and rating work between them
+    job_ids = list(dict.fromkeys(batch_request.job_ids))
+    if not job_ids:
+        raise HTTPException(status_code=400, detail="No jobs to match")
+
+    timings = {}
+    with timed(timings, "load_job", jobs=len(job_ids)):
+        rows = supabase.table("jobs").select("*").in_("job_id", job_ids).execute().data
+    missing = set(job_ids) - {row["job_id"] for row in rows}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Jobs not found: {sorted(missing)}")
+
+    jobs = []
+    for row in rows:
+        job = Job.init_job(**row)
+        if job.rating_schema["properties"].keys() != job.rating_schema_weights.keys():
+            raise HTTPException(status_code=400, detail=f"Schema categories and weight categories do not match for job {job.job_id}")
+        query_embedding = row.get("query_embedding")
+        jobs.append((job, json.loads(query_embedding) if isinstance(query_embedding, str) else query_embedding))
+
+    failed = {}
+    matches = await calculate_batch_matches(jobs, timings=timings, failed=failed)
+
+    # Jobs whose every rating failed keep their stored ranking and are left out of the response
+    unrated = {job_id for job_id in failed if not matches.get(job_id)}
+    if unrated and len(unrated) == len(job_ids):
+        raise HTTPException(status_code=502, detail="Rating candidates failed, please try again later")
+    sorted_matches = {
+        job_id: sorted([CandidateMatch(**match, job_id=job_id, candidate_id=str(match["id"])) for match in job_matches], reverse=True)
+        for job_id, job_matches in matches.items() if job_id not in unrated
+    }
+
+    # Replace the stored matches of every job in two round trips, keeping the rows of candidates whose rating failed
+    with timed(timings, "save_matches", jobs=len(sorted_matches)):
+        match_repository.replace_matches(list(sorted_matches), [match for job_matches in sorted_matches.values() for match in job_matches], keep=failed)
+    response.headers["Server-Timing"] = server_timing_header(timings)
 
     return sorted_matches
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/calculate_matches_stream")
+async def calculate_matches_stream(current_user: Annotated[User, Depends(get_current_user)], job_id: str):
+    # Server-Sent Events variant of calculate_matches. Emits a "retrieval" event with the retrieved
+    # candidates, a "match" event for each candidate as soon as it has been rated, a "timings" event
+    # with per-stage latency and a final "done" event with the sorted matches. Each match is saved as it arrives,
+    # and the previous ranking's leftover rows are removed once the stream ends.
+    timings = {}
+    job, query_embedding = await load_matching_job(job_id, timings)
+
+    async def event_stream():
+        resume_list = await retrieve_resumes(job.rating_schema, query_embedding=query_embedding, config=job.matching_config, rerank_query=job.job_desc, timings=timings)
+        yield sse_event("retrieval", [{"id": resume["id"], "name": resume["name"]} for resume in resume_list])
+
+        generation = match_repository.new_generation()
+        matches = []
+        failed = set()
+        rated_resumes = iter_rated_resumes(resume_list, make_resume_rater(job.rating_schema, job.matching_config), failed=failed)
+        try:
+            while True:
+                # Only the wait for ratings counts as "rate"; saves and the client reading events are timed apart
+                with timed(timings, "rate"):
+                    try:
+                        _, rated_resume = await anext(rated_resumes)
+                    except StopAsyncIteration:
+                        break
+                score = float(score_candidates([rated_resume["ratings"]], job.rating_schema_weights)[0])
+                match = CandidateMatch(**rated_resume, score=score, job_id=job_id, candidate_id=str(rated_resume["id"]), generation=generation)
+                with timed(timings, "save_matches"):
+                    await asyncio.to_thread(match_repository.upsert_matches, [match])
+                matches.append(match)
+                yield sse_event("match", match.model_dump())
+        finally:
+            # Also runs when the client disconnects mid-stream. Retrieved candidates without a new rating (failed,
+            # or not reached yet) keep their stored rows, and, as in calculate_matches, a refresh whose every rating
+            # failed leaves the stored ranking alone.
+            await rated_resumes.aclose()
+            if matches or not failed:
+                unrated = {str(resume["id"]) for resume in resume_list} - {match.candidate_id for match in matches}
+                with timed(timings, "save_matches"):
+                    await asyncio.shield(asyncio.to_thread(match_repository.delete_stale, [job_id], generation, {job_id: unrated}))
+
+        if failed and not matches:
+            yield sse_event("error", {"detail": "Rating candidates failed, please try again later"})
+            return
+        yield sse_event("timings", timings)
+        yield sse_event("done", [match.model_dump() for match in sorted(matches, reverse=True)])
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/rescore_matches", response_model=List[CandidateMatch])
+async def rescore_matches(current_user: Annotated[User, Depends(get_current_user)], job_id: str):
+    # Re-rank stored matches after a weight change, reusing their stored ratings instead of re-rating
+    job = Job.init_job(**supabase.table("jobs").select("*").eq("job_id", job_id).execute().data[0])
+    schema_weights_dict = job.rating_schema_weights
+
+    matches = match_repository.get_matches(job_id)
+    if not matches:
+        return []
+
+    # Stored ratings only cover the categories they were rated on, so a schema change needs a full recalculation.
+    # Rows saved before candidate ids were stored can't be upserted in place either.
+    if any(match.ratings.keys() != schema_weights_dict.keys() or match.candidate_id is None for match in matches):
+        raise HTTPException(status_code=409, detail="Stored ratings do not match the current rating schema. Please recalculate matches.")
+
+    scores = score_candidates([match.ratings for match in matches], schema_weights_dict)
+
+    changed_matches = []
+    for match, score in zip(matches, scores.tolist()):
+        if match.score != score:
+            match.score = score
+            changed_matches.append(match)
+
+    # Write back only the changed scores in a single bulk upsert, keeping each row's generation
+    match_repository.upsert_matches(changed_matches)
+
+    return sorted(matches, reverse=True)
+
 @router.get("/get_matches", response_model=List[CandidateMatch])
 async def get_matches(current_user: Annotated[User, Depends(get_current_user)], job_id: str):
-    matches = supabase.table("matches").select("*").eq("job_id", job_id).execute().data
-    return [CandidateMatch(**match) for match in matches]
+    return match_repository.get_matches(job_id)
@@ -2,7 +2,7 @@ from pydantic import BaseModel
 from typing import Literal
 from fastapi import APIRouter, HTTPException
 from uuid import uuid4
-from utils.auth import get_password_hash, supabase
+from utils.auth import hash_password, invalidate_user, supabase
 # from utils.env import env
 
 router = APIRouter()
@@ -17,8 +17,8 @@ class RegisterRequest(BaseModel):
 
 @router.post("/register")
 async def register(request: RegisterRequest):
-    # Hash the password for security
-    hashed_password = get_password_hash(request.password)
+    # Hash the password for security, off the event loop
+    hashed_password = await hash_password(request.password)
     
     # Prepare user data for Supabase
     user_data = {
@@ -37,4 +37,6 @@ async def register(request: RegisterRequest):
         supabase.table("users").insert(user_data).execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
+    finally:
+        invalidate_user(request.email)
     
@@ -2,54 +2,49 @@ from fastapi import APIRouter
 from fastapi import UploadFile, File
 from typing import Annotated
 from fastapi import Depends, HTTPException
-import PyPDF2
-import io
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
+from pathlib import Path
+from uuid import uuid4
+import asyncio
 
-from utils.embedding import build_qdrant_vector
-from utils.env import env
+from utils.ingest_queue import ingest_queue, UPLOAD_DIR, MAX_QUEUED_UPLOADS
 from utils.auth import get_current_user
-from models import User
+from utils.pdf import MAX_PDF_BYTES
+from models import User, IngestJob
 
 router = APIRouter()
 
-vector_client = QdrantClient(url=env["QDRANT_URL"], api_key=env["QDRANT_API_KEY"])
-
 @router.post("/upload")
 async def upload(current_user: Annotated[User, Depends(get_current_user)], file: UploadFile = File(...)):
     # Check if file is a PDF
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
-    
-    try:
-        # Read file content
-        contents = await file.read()
-        
-        # Create a file-like object from the bytes
-        pdf_file = io.BytesIO(contents)
-        
-        # Create PDF reader object
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        # Extract text from all pages
-        text_content = ""
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text_content += page.extract_text()
-
-        # Create two embeddings for the resume:
-        # BM42: good balance of keyword matching and semantic meaning
-        # Jina: good at semantic meaning, but not as good at keyword matching
-        vec = build_qdrant_vector(text_content)
-
-        # Insert resume into vector database
-        vector_client.upsert(collection_name="talent-pool", points=[
-            PointStruct(id=current_user.uuid, vector=vec, payload={"resume": text_content, "name": current_user.name}
-        )])
-        
-    except Exception as e:
-        return {"error": str(e)}
+
+    # Shed load instead of letting the queue grow without bound during upload spikes
+    # Queue calls run off the event loop: they can wait on a worker's write lock
+    if await asyncio.to_thread(ingest_queue.pending_count) >= MAX_QUEUED_UPLOADS:
+        raise HTTPException(status_code=503, detail="Too many uploads in progress, please try again shortly", headers={"Retry-After": "30"})
+
+    # Oversized files are rejected before they are read into memory (the workers would refuse them anyway)
+    if file.size is not None and file.size > MAX_PDF_BYTES:
+        raise HTTPException(status_code=413, detail=f"PDF files are limited to {MAX_PDF_BYTES // (1024 * 1024)} MB")
+
+    # Persist the raw PDF and hand it to the ingestion workers (see worker.py),
+    # which extract the text, embed it and insert it into the vector database
+    contents = await file.read()
+    path = Path(UPLOAD_DIR) / f"{uuid4()}.pdf"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(path.write_bytes, contents)
+
+    # The owner's location goes into the resume's payload, for jobs that filter candidates by it
+    job_id = await asyncio.to_thread(ingest_queue.enqueue, current_user.uuid, current_user.name, str(path), {"city": current_user.city, "country": current_user.country})
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/upload_status", response_model=IngestJob)
+async def upload_status(current_user: Annotated[User, Depends(get_current_user)], job_id: str):
+    job = await asyncio.to_thread(ingest_queue.get, job_id)
+    if job is None or job["user_id"] != current_user.uuid:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return IngestJob(**job)
 
 @router.get("/profile")
 async def profile(current_user: Annotated[User, Depends(get_current_user)]):
@@ -0,0 +1,51 @@
+-- Schema the matching code expects on top of the original jobs and matches tables.
+-- Apply with `supabase db push`, or paste into the Supabase SQL editor. Safe to run more than once.
+
+-- Embedding of the rating categories, refreshed when they change (utils/matching.py)
+alter table jobs add column if not exists query_embedding jsonb;
+-- Per-job retrieval and rating settings (models.MatchingConfig)
+alter table jobs add column if not exists matching_config jsonb;
+
+-- Rows are keyed on (job_id, candidate_id) and stamped with the refresh that wrote them (utils/match_store.py)
+alter table matches add column if not exists candidate_id text;
+alter table matches add column if not exists generation bigint;
+-- Version of the resume the ratings were made from (utils/resume_index.py)
+alter table matches add column if not exists resume_version bigint;
+
+do $$
+begin
+    if not exists (select 1 from pg_constraint where conname = 'matches_job_id_candidate_id_key') then
+        alter table matches add constraint matches_job_id_candidate_id_key unique (job_id, candidate_id);
+    end if;
+end
+$$;
+
+-- Replaces the rankings of p_job_ids with p_matches in one transaction: upserts the new rows, then deletes the
+-- rows older refreshes left behind, except those of the candidates in p_keep (job id -> array of candidate ids).
+-- See SupabaseMatchRepository.replace_matches.
+create or replace function replace_matches(p_job_ids text[], p_matches jsonb, p_generation bigint, p_keep jsonb default '{}')
+returns void
+language plpgsql
+as $$
+begin
+    -- Concurrent refreshes of the same job wait for each other, in a fixed order so they can't deadlock
+    perform pg_advisory_xact_lock(hashtext(job_id)) from unnest(p_job_ids) as job_id order by job_id;
+
+    insert into matches (job_id, candidate_id, resume, score, name, ratings, generation, resume_version)
+    select job_id, candidate_id, resume, score, name, ratings, p_generation, resume_version
+    from jsonb_populate_recordset(null::matches, p_matches)
+    on conflict (job_id, candidate_id) do update set
+        resume = excluded.resume,
+        score = excluded.score,
+        name = excluded.name,
+        ratings = excluded.ratings,
+        generation = excluded.generation,
+        resume_version = excluded.resume_version;
+
+    -- Rows from before generations existed have a null generation and are stale as well
+    delete from matches
+    where job_id::text = any(p_job_ids)
+        and (generation < p_generation or generation is null)
+        and not coalesce((p_keep -> job_id::text) ? candidate_id, false);
+end
+$$;
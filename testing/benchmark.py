@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import resource
+import threading
+import time
+import uuid
+import zlib
+from typing import Iterator
+
+import numpy as np
+import uvicorn
+from qdrant_client import AsyncQdrantClient, models
+from ranx import Qrels, Run, evaluate
+
+from utils.env import env
+
+# Offline benchmark of ingestion, retrieval and matching speed alongside ranking quality, e.g.:
+# python -m testing.benchmark --pool-sizes 1000 10000 100000 --llm-latency 0.3
+# Runs against an in-memory Qdrant and the fake OpenAI server (testing/fake_openai.py), so it needs no
+# API keys or network. For each pool size, the test collection's resumes are hidden among synthetic
+# resumes, and the rankings are scored against their ratings with ranx.
+# --embedder hash swaps the fastembed models for a deterministic hashing embedder, for pools too large
+# to embed for real; its quality numbers are only comparable with other hash runs.
+
+PORT = 8766
+env["OPENAI_API_KEY"] = env.get("OPENAI_API_KEY") or "fake-key"
+env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+env["QDRANT_URL"] = ":memory:"
+
+from testing import fake_openai
+from models import MatchingConfig
+from utils import matching
+from utils.agents import SchemaMakerAgent
+from utils.hashing import hash_text
+from utils.ingestion import batched
+from utils.rating_cache import RatingCache
+from utils.vector_db import collection_config, get_async_vector_client
+
+COLLECTION_NAME = "talent-pool-benchmark"
+
+class HashEmbedder:
+    # Sparse vectors of hashed token counts and dense vectors summed from per-token pseudo-random vectors.
+    # Deterministic and fast enough for million-resume pools.
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+        self.token_vectors: dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def tokens(text: str) -> list[str]:
+        return re.findall(r"[a-z0-9+#]+", text.lower())
+
+    def token_vector(self, token: str) -> np.ndarray:
+        vector = self.token_vectors.get(token)
+        if vector is None:
+            vector = np.random.default_rng(zlib.crc32(token.encode())).standard_normal(self.dim, dtype=np.float32)
+            self.token_vectors[token] = vector
+        return vector
+
+    def embed(self, text: str) -> tuple[dict, list[float]]:
+        counts: dict[int, int] = {}
+        dense = np.zeros(self.dim, dtype=np.float32)
+        for token in self.tokens(text):
+            index = zlib.crc32(token.encode()) & 0xFFFFF
+            counts[index] = counts.get(index, 0) + 1
+            dense += self.token_vector(token)
+        norm = float(np.linalg.norm(dense)) or 1.0
+        sparse = {"indices": list(counts), "values": [1.0 + float(np.log(count)) for count in counts.values()]}
+        return sparse, (dense / norm).tolist()
+
+    def passages(self, texts: list[str]) -> list[dict]:
+        vectors = []
+        for text in texts:
+            sparse, dense = self.embed(text)
+            vectors.append({"bm42": models.SparseVector(**sparse), "jina": dense})
+        return vectors
+
+    def query_embedding(self, rating_schema: dict) -> dict:
+        query_text = matching.schema_query_text(rating_schema)
+        sparse, dense = self.embed(query_text)
+        return {"schema_hash": hash_text(query_text), "bm42": sparse, "jina": dense}
+
+class FastEmbedder:
+    # The models the app uses
+    dim = 768
+
+    def passages(self, texts: list[str]) -> list[dict]:
+        from utils.embedding import build_qdrant_vectors
+        return build_qdrant_vectors(texts)
+
+    def query_embedding(self, rating_schema: dict) -> dict:
+        return matching.build_query_embedding(rating_schema)
+
+def start_fake_server(latency: float) -> None:
+    fake_openai.LATENCY = latency
+    server = uvicorn.Server(uvicorn.Config(fake_openai.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+def synthetic_resumes(base_resumes: list[dict], count: int, seed: int) -> Iterator[dict]:
+    # Resumes stitched together from lines of the test collection's resumes, so the pool shares their
+    # vocabulary and competes with them for the top ranks
+    rng = random.Random(seed)
+    lines = [line for resume in base_resumes for line in resume["resume"].splitlines() if line.strip()]
+    for i in range(count):
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "name": f"Synthetic Candidate {i}",
+            "resume": "\n".join(rng.sample(lines, k=min(len(lines), rng.randint(15, 30)))),
+        }
+
+def percentiles(seconds: list[float]) -> dict:
+    samples = np.array(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 2),
+        "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        "p99_ms": round(float(np.percentile(samples, 99)), 2),
+        "mean_ms": round(float(samples.mean()), 2),
+        "samples": len(seconds),
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def mean_timings(timings_list: list[dict[str, float]]) -> dict[str, float]:
+    stages = {stage for timings in timings_list for stage in timings}
+    return {stage: round(1000 * sum(timings.get(stage, 0.0) for timings in timings_list) / len(timings_list), 2) for stage in sorted(stages)}
+
+async def create_collection(client: AsyncQdrantClient, dim: int) -> None:
+    # Same layout as testing/create_qdrant_collection.py
+    await client.create_collection(collection_name=COLLECTION_NAME, **collection_config(dim))
+
+async def ingest(client: AsyncQdrantClient, resumes: Iterator[dict], embedder, batch_size: int) -> dict:
+    docs = 0
+    embed_seconds = upsert_seconds = 0.0
+    for batch in batched(resumes, batch_size):
+        start = time.perf_counter()
+        vectors = await asyncio.to_thread(embedder.passages, [resume["resume"] for resume in batch])
+        embed_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        points = [
+            models.PointStruct(id=resume["id"], vector=vector, payload={"resume": resume["resume"], "name": resume["name"]})
+            for resume, vector in zip(batch, vectors)
+        ]
+        await client.upsert(collection_name=COLLECTION_NAME, points=points)
+        upsert_seconds += time.perf_counter() - start
+        docs += len(batch)
+    seconds = embed_seconds + upsert_seconds
+    return {
+        "docs": docs,
+        "seconds": round(seconds, 2),
+        "docs_per_sec": round(docs / seconds, 1) if seconds else None,
+        "embed_seconds": round(embed_seconds, 2),
+        "upsert_seconds": round(upsert_seconds, 2),
+    }
+
+async def timed_runs(jobs: list[dict], queries: int, concurrency: int, run) -> tuple[list[float], list]:
+    # Runs queries calls of run(job), cycling through the jobs, with up to concurrency calls at once.
+    # Returns each call's latency and result.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await run(jobs[i % len(jobs)])
+            return time.perf_counter() - start, result
+
+    results = await asyncio.gather(*(one(i) for i in range(queries)))
+    return [seconds for seconds, _ in results], [result for _, result in results]
+
+async def benchmark_pool(pool_size: int, jobs: list[dict], test_resumes: list[dict], embedder, config: MatchingConfig, args) -> dict:
+    # The in-memory client the pipeline uses; the collection is rebuilt for every pool size
+    client = get_async_vector_client()
+    await create_collection(client, embedder.dim)
+
+    resumes = itertools.chain(test_resumes, synthetic_resumes(test_resumes, max(0, pool_size - len(test_resumes)), args.seed))
+    ingestion = await ingest(client, resumes, embedder, args.batch_size)
+
+    for job in jobs:
+        job["query_embedding"] = embedder.query_embedding(job["rating_schema"])
+
+    async def retrieve(job: dict):
+        return await matching.retrieve_resumes(job["rating_schema"], COLLECTION_NAME, job["query_embedding"], config, job["job_description"])
+
+    def match(cache: RatingCache | None, timings_list: list[dict]):
+        async def run(job: dict):
+            timings = {}
+            matches = await matching.calculate_resume_matches(
+                job["rating_schema"], job["rating_schema_weights"], COLLECTION_NAME, job["query_embedding"], config,
+                job["job_description"], timings, cache=cache
+            )
+            timings_list.append(timings)
+            return job["category"], matches
+        return run
+
+    retrieval_seconds, _ = await timed_runs(jobs, args.queries, args.concurrency, retrieve)
+
+    # Cold runs rate every candidate; warm runs find every rating in the cache
+    cold_timings, warm_timings = [], []
+    cold_seconds, cold_results = await timed_runs(jobs, args.queries, args.concurrency, match(None, cold_timings))
+    cache = RatingCache(":memory:")
+    await timed_runs(jobs, len(jobs), args.concurrency, match(cache, []))
+    warm_seconds, _ = await timed_runs(jobs, args.queries, args.concurrency, match(cache, warm_timings))
+
+    # Ranking quality of the first cold run of each job, against the test collection's ratings
+    run_dict = {job["category"]: {} for job in jobs}
+    for category, matches in cold_results[:len(jobs)]:
+        run_dict[category] = {str(candidate["id"]): candidate["score"] for candidate in matches}
+    qrels = Qrels({job["category"]: {resume["id"]: resume["rating"] for resume in job["resumes"]} for job in jobs})
+    quality = evaluate(qrels, Run(run_dict), metrics=["ndcg@5", "mrr"])
+
+    await client.delete_collection(COLLECTION_NAME)
+    return {
+        "pool_size": pool_size,
+        "ingestion": ingestion,
+        "retrieval_latency": percentiles(retrieval_seconds),
+        "match_latency_cold": percentiles(cold_seconds) | {"stages_ms": mean_timings(cold_timings)},
+        "match_latency_warm": percentiles(warm_seconds) | {"stages_ms": mean_timings(warm_timings)},
+        "quality": {metric: round(float(score), 4) for metric, score in quality.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def main(args) -> list[dict]:
+    start_fake_server(args.llm_latency)
+    config = MatchingConfig.model_validate_json(args.matching_config)
+    embedder = HashEmbedder() if args.embedder == "hash" else FastEmbedder()
+
+    with open("testing/clean_test_collection.json", "r") as f:
+        jobs = json.load(f)
+    test_resumes = list({resume["id"]: resume for job in jobs for resume in job["resumes"]}.values())
+
+    # Rating schemas come from the fake schema maker, so they are the same on every run
+    schema_maker = SchemaMakerAgent()
+    for job in jobs:
+        job["rating_schema"] = json.loads(await schema_maker.respond(job["job_description"]))
+        job["rating_schema_weights"] = {key: 1.0 for key in job["rating_schema"]["properties"]}
+
+    results = []
+    for pool_size in args.pool_sizes:
+        result = await benchmark_pool(pool_size, jobs, test_resumes, embedder, config, args)
+        print(json.dumps(result, indent=4))
+        results.append(result)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and matching against local stand-ins for Qdrant and OpenAI")
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--embedder", choices=["fastembed", "hash"], default="fastembed")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds the fake LLM takes per call")
+    parser.add_argument("--queries", type=int, default=40, help="Timed calls per measurement")
+    parser.add_argument("--concurrency", type=int, default=1, help="Match requests in flight at once")
+    parser.add_argument("--batch-size", type=int, default=256, help="Ingestion batch size")
+    parser.add_argument("--matching-config", default="{}", help='MatchingConfig JSON, e.g. \'{"reranker": "weighted"}\'')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="testing/benchmark_results.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    json.dump({"args": vars(args), "results": results}, open(args.output, "w"), indent=4)
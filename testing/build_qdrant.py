@@ -2,7 +2,7 @@ from qdrant_client import QdrantClient, models
 from qdrant_client.models import PointStruct, VectorStruct
 import json
 from utils.env import env
-from utils.embedding import build_qdrant_vector
+from utils.embedding import build_qdrant_vectors
 
 vector_client = QdrantClient(url=env["QDRANT_URL"], api_key=env["QDRANT_API_KEY"])
 
@@ -18,13 +18,15 @@ for job in data:
         if id not in points:
             # Add gain category to Qdrant payload
             resume[gain_cat] = resume["rating"]
-            # Create Qdrant vector consisting of BM42 (sparse) and Jina (dense) embeddings
-            vec = build_qdrant_vector(resume["resume"])
-            point = {"vector": vec, "payload": resume}
-            points[id] = point
+            points[id] = {"payload": resume}
         else:
             points[id]["payload"][gain_cat] = resume["rating"]
 
+# Create Qdrant vectors consisting of BM42 (sparse) and Jina (dense) embeddings, in one batched pass
+vectors = build_qdrant_vectors([point["payload"]["resume"] for point in points.values()])
+for point, vec in zip(points.values(), vectors):
+    point["vector"] = vec
+
 points_list = [PointStruct(id=id, **point) for id, point in points.items()]
             
 vector_client.upsert(collection_name="talent-pool", points=points_list)
\ No newline at end of file
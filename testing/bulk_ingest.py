@@ -0,0 +1,29 @@
+import argparse
+import json
+from utils.chunking import CHUNK_COLLECTION, chunks_enabled
+from utils.ingestion import ingest_resumes, iter_resumes
+from utils.vector_db import get_vector_client
+
+# Bulk resume ingestion, e.g.:
+# python -m testing.bulk_ingest resumes/ --parallel 4 --checkpoint ingest.checkpoint
+parser = argparse.ArgumentParser(description="Embed and upsert resumes from JSON/JSONL files and PDF directories")
+parser.add_argument("paths", nargs="+", help="Files or directories of .json, .jsonl and .pdf resumes")
+parser.add_argument("--collection", default="talent-pool")
+parser.add_argument("--upsert-batch-size", type=int, default=256)
+parser.add_argument("--embed-batch-size", type=int, default=32)
+parser.add_argument("--parallel", type=int, default=None, help="fastembed worker processes (0 = all cores)")
+parser.add_argument("--chunks", action="store_true", help="Also store section chunks (on by default with RESUME_CHUNKS=1)")
+parser.add_argument("--checkpoint", default=None, help="File of ingested ids, used to resume an interrupted run")
+args = parser.parse_args()
+
+stats = ingest_resumes(
+    iter_resumes(args.paths),
+    get_vector_client(),
+    collection_name=args.collection,
+    upsert_batch_size=args.upsert_batch_size,
+    embed_batch_size=args.embed_batch_size,
+    parallel=args.parallel,
+    checkpoint_path=args.checkpoint,
+    chunk_collection_name=CHUNK_COLLECTION if args.chunks or chunks_enabled() else None,
+)
+print(json.dumps(stats, indent=4))
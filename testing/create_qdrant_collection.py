@@ -1,19 +1,45 @@
-from qdrant_client import QdrantClient, models
-from utils.env import env
+import argparse
+import json
 
-vector_client = QdrantClient(url=env["QDRANT_URL"], api_key=env["QDRANT_API_KEY"])
+from qdrant_client import models
 
-vector_client.create_collection(
-    collection_name="talent-pool",
-    vectors_config={
-        "jina": models.VectorParams(
-            size=768,
-            distance=models.Distance.COSINE,
-        )
-    },
-    sparse_vectors_config={
-        "bm42": models.SparseVectorParams(
-            modifier=models.Modifier.IDF,
-        )
-    }
-)
\ No newline at end of file
+from utils.chunking import CHUNK_COLLECTION
+from utils.vector_db import PAYLOAD_INDEXES, collection_config, estimated_ram_bytes, get_vector_client
+
+# Collection provisioning, e.g. for a pool of a million resumes or more on a modest node:
+# python -m testing.create_qdrant_collection --quantization scalar --on-disk
+# Without options, creates the original layout: full-precision vectors and HNSW graph in RAM.
+# Use testing/quantization_benchmark.py to pick the settings, and MatchingConfig's hnsw_ef and
+# quantization_oversampling to tune searches against the result.
+parser = argparse.ArgumentParser(description="Create a resume collection with its vector, HNSW, quantization and payload index settings")
+parser.add_argument("--collection", default="talent-pool")
+parser.add_argument("--dim", type=int, default=768, help="Jina embedding size")
+parser.add_argument("--quantization", choices=["none", "scalar", "binary"], default="none")
+parser.add_argument("--on-disk", action="store_true", help="Keep original vectors and the HNSW graph on disk (memory-mapped)")
+parser.add_argument("--quantized-on-disk", action="store_true", help="Keep quantized vectors on disk too, instead of always in RAM")
+parser.add_argument("--hnsw-m", type=int, default=16, help="Edges per node; higher means better recall and more memory")
+parser.add_argument("--hnsw-ef-construct", type=int, default=100, help="Build-time search depth; higher means a better graph and slower indexing")
+parser.add_argument("--expected-points", type=int, default=1_000_000, help="Pool size for the RAM estimate")
+parser.add_argument("--recreate", action="store_true", help="Delete the collection first if it exists")
+parser.add_argument("--chunks", action="store_true", help=f"Also create the section chunk collection ({CHUNK_COLLECTION}) with the same settings")
+args = parser.parse_args()
+
+vector_client = get_vector_client()
+
+def create(collection_name: str, payload_indexes: dict) -> None:
+    if args.recreate and vector_client.collection_exists(collection_name):
+        vector_client.delete_collection(collection_name)
+    vector_client.create_collection(
+        collection_name=collection_name,
+        **collection_config(args.dim, args.quantization, args.on_disk, args.hnsw_m, args.hnsw_ef_construct, always_ram=not args.quantized_on_disk),
+    )
+    for field_name, field_schema in payload_indexes.items():
+        vector_client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=field_schema)
+
+create(args.collection, PAYLOAD_INDEXES)
+# Chunks are grouped and replaced by candidate_id
+if args.chunks:
+    create(CHUNK_COLLECTION, PAYLOAD_INDEXES | {"candidate_id": models.PayloadSchemaType.KEYWORD})
+
+ram_bytes = estimated_ram_bytes(args.expected_points, args.dim, args.quantization, args.on_disk, args.hnsw_m, always_ram=not args.quantized_on_disk)
+print(json.dumps({"collection": args.collection, "expected_points": args.expected_points, "estimated_vector_ram_mb": round(ram_bytes / 2**20, 1)}, indent=4))
@@ -1,12 +1,12 @@
+import asyncio
 import json
-import threading
 from ranx import Qrels, Run, evaluate
 
 from testing.matching import get_matches
 
 # Retrieve matches, and compile scores into a dictionary
-def get_match_scores(job_desc: str, category: str, run_dict: dict):
-    matches = get_matches(job_desc)
+async def get_match_scores(job_desc: str, category: str, run_dict: dict):
+    matches = await get_matches(job_desc)
     for match in matches:
         score = match["score"]
         run_dict[category][match["id"]] = score
@@ -20,7 +20,7 @@ qrels_dict = {}
 # Dictionary of match scores for each resume in each job
 # This will be compared with the gain scores to calculate NDCG
 run_dict = {}
-threads = []
+tasks = []
 
 for job in test_collection:
     # Build qrels dictionary
@@ -31,13 +31,12 @@ for job in test_collection:
     run_dict[job["category"]] = {}
 
     # Get match scores
-    thread = threading.Thread(target=get_match_scores, args=(job["job_description"], job["category"], run_dict))
-    thread.start()
-    threads.append(thread)
+    tasks.append(get_match_scores(job["job_description"], job["category"], run_dict))
 
+async def run_all():
+    await asyncio.gather(*tasks)
 
-for thread in threads:
-    thread.join()
+asyncio.run(run_all())
 
 # We need to create both objects, and then we can evaluate the run against the qrels
 qrels = Qrels(qrels_dict)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import Counter
+from uuid import uuid4
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+# Local stand-in for the parts of the OpenAI API the agents use: chat completions with
+# json_object (schema maker) and json_schema (raters) response formats, files and batches.
+# Schemas are built from the most frequent words of the job description, and ratings are based on
+# how often the words of each rating category appear in the resume, so runs are reproducible.
+# Run with: FAKE_OPENAI_LATENCY=0.5 uvicorn testing.fake_openai:app --port 8765
+# and point the app at it with OPENAI_BASE_URL=http://localhost:8765/v1 in .env
+
+app = FastAPI()
+
+LATENCY = float(os.environ.get("FAKE_OPENAI_LATENCY", "0"))
+CANDIDATE_PATTERN = re.compile(r'<candidate id="([^"]+)">\n(.*?)\n</candidate>', re.DOTALL)
+SCHEMA_CATEGORIES = 6
+STOPWORDS = {
+    "about", "also", "and", "are", "been", "being", "both", "candidate", "each", "experience", "from", "have",
+    "including", "into", "knowledge", "must", "other", "our", "role", "should", "skills", "strong", "team",
+    "that", "their", "them", "they", "this", "through", "well", "were", "what", "will", "with", "work",
+    "working", "years", "you", "your",
+}
+
+files: dict[str, dict] = {}
+batches: dict[str, dict] = {}
+
+def fake_rating(category: str, resume: str) -> int:
+    words = [word for word in re.split(r"[\W_]+", category.lower()) if len(word) > 2]
+    text = resume.lower()
+    return min(10, 1 + sum(3 * text.count(word) for word in words))
+
+def fake_ratings(properties: dict, resume: str) -> dict:
+    return {category: fake_rating(category, resume) for category in properties}
+
+def fake_schema(job_description: str) -> dict:
+    words = [word for word in re.findall(r"[a-z][a-z+#]{3,}", job_description.lower()) if word not in STOPWORDS]
+    categories = [word for word, _ in Counter(words).most_common(SCHEMA_CATEGORIES)]
+    return {
+        "type": "object",
+        "properties": {
+            category: {"type": "integer", "description": f"Rate the candidate's {category} skills on a scale of 1 to 10."}
+            for category in categories
+        },
+        "required": categories,
+        "additionalProperties": False,
+    }
+
+def fake_content(body: dict) -> str:
+    user_message = body["messages"][-1]["content"]
+    if body["response_format"]["type"] == "json_object":
+        return json.dumps(fake_schema(user_message))
+    schema = body["response_format"]["json_schema"]["schema"]
+    ratings = schema["properties"].get("ratings")
+    if ratings and ratings.get("type") == "array":
+        properties = {key: value for key, value in ratings["items"]["properties"].items() if key != "candidate_id"}
+        return json.dumps({"ratings": [
+            {"candidate_id": candidate_id} | fake_ratings(properties, resume)
+            for candidate_id, resume in CANDIDATE_PATTERN.findall(user_message)
+        ]})
+    return json.dumps(fake_ratings(schema["properties"], user_message))
+
+def fake_completion(body: dict) -> dict:
+    content = fake_content(body)
+    prompt_tokens = sum(len(message["content"]) // 4 for message in body["messages"])
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-{uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content, "refusal": None},
+            "finish_reason": "stop",
+            "logprobs": None,
+        }],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+    return fake_completion(body)
+
+def file_object(file_id: str) -> dict:
+    file = files[file_id]
+    return {
+        "id": file_id, "object": "file", "bytes": len(file["content"]), "created_at": file["created_at"],
+        "filename": file["filename"], "purpose": file["purpose"], "status": "processed",
+    }
+
+def store_file(content: bytes, filename: str, purpose: str) -> str:
+    file_id = f"file-{uuid4().hex}"
+    files[file_id] = {"content": content, "filename": filename, "purpose": purpose, "created_at": int(time.time())}
+    return file_id
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    return file_object(store_file(await file.read(), file.filename, purpose))
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return Response(content=files[file_id]["content"], media_type="application/octet-stream")
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    # Batches complete immediately: every request line is answered as a chat completion
+    body = await request.json()
+    if body["input_file_id"] not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    output_lines = []
+    for line in files[body["input_file_id"]]["content"].decode().splitlines():
+        if not line.strip():
+            continue
+        batch_request = json.loads(line)
+        output_lines.append(json.dumps({
+            "id": f"batch_req_{uuid4().hex}",
+            "custom_id": batch_request["custom_id"],
+            "response": {"status_code": 200, "request_id": uuid4().hex, "body": fake_completion(batch_request["body"])},
+            "error": None,
+        }))
+
+    batch_id = f"batch_{uuid4().hex}"
+    output_file_id = store_file("\n".join(output_lines).encode() + b"\n", f"{batch_id}_output.jsonl", "batch_output")
+    now = int(time.time())
+    batches[batch_id] = {
+        "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+        "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+        "status": "completed", "output_file_id": output_file_id, "error_file_id": None,
+        "created_at": now, "in_progress_at": now, "completed_at": now,
+        "request_counts": {"total": len(output_lines), "completed": len(output_lines), "failed": 0},
+    }
+    return batches[batch_id]
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batches[batch_id]
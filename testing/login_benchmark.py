@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from uuid import uuid4
+
+import numpy as np
+from passlib.context import CryptContext
+
+from utils.env import env
+
+# Login throughput and event loop responsiveness under a login storm, e.g.:
+# python -m testing.login_benchmark --rounds 10 12 --workers 4 --logins 200
+# Compares verifying passwords inline on the event loop (the old behaviour) with authenticate_user,
+# which verifies them in the password pool. Users are served from the user cache, so no Supabase is needed.
+
+parser = argparse.ArgumentParser(description="Benchmark login throughput per core")
+parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12], help="bcrypt cost factors of the stored hashes")
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Password pool threads")
+parser.add_argument("--logins", type=int, default=100, help="Logins per measurement")
+parser.add_argument("--concurrency", type=int, default=50, help="Logins in flight at once")
+args = parser.parse_args()
+
+env["PASSWORD_HASH_WORKERS"] = str(args.workers)
+# Stored hashes are never cheaper than BCRYPT_ROUNDS here, so no login triggers a rehash
+env["BCRYPT_ROUNDS"] = str(min(args.rounds))
+for name in ["JWT_SECRET", "JWT_ALGO", "SUPABASE_URL", "SUPABASE_KEY"]:
+    env[name] = env.get(name) or {"JWT_ALGO": "HS256", "SUPABASE_URL": "http://127.0.0.1:54321"}.get(name, "benchmark")
+
+from models import UserInDB
+from utils.auth import authenticate_user, user_cache, verify_password
+
+PASSWORD = "correct horse battery staple"
+
+def make_user(rounds: int) -> UserInDB:
+    email = f"benchmark-{rounds}-{uuid4().hex}@example.com"
+    hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash(PASSWORD)
+    user = UserInDB(email=email, name="Benchmark", user_type="user", city="", country="", uuid=str(uuid4()), hashed_password=hashed_password)
+    user_cache.set(email, user)
+    return user
+
+async def inline_login(user: UserInDB) -> bool:
+    return verify_password(PASSWORD, user.hashed_password)
+
+async def pooled_login(user: UserInDB) -> bool:
+    return bool(await authenticate_user(user.email, PASSWORD))
+
+async def measure(login, user: UserInDB, cores: int) -> dict:
+    # Meanwhile, a heartbeat task measures how late the event loop wakes it up, i.e. how long
+    # every other request on this worker would be stalled
+    lags = []
+    stop = asyncio.Event()
+
+    async def heartbeat():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start - 0.01)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> bool:
+        async with semaphore:
+            return await login(user)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(args.logins)))
+    seconds = time.perf_counter() - start
+    stop.set()
+    await heartbeat_task
+    assert all(results)
+
+    lags_ms = np.array(lags) * 1000
+    return {
+        "logins_per_sec": round(args.logins / seconds, 1),
+        "logins_per_sec_per_core": round(args.logins / seconds / cores, 1),
+        "loop_lag_p50_ms": round(float(np.percentile(lags_ms, 50)), 2),
+        "loop_lag_p99_ms": round(float(np.percentile(lags_ms, 99)), 2),
+        "loop_lag_max_ms": round(float(lags_ms.max()), 2),
+    }
+
+async def main() -> list[dict]:
+    results = []
+    for rounds in args.rounds:
+        user = make_user(rounds)
+        # Inline verification can only ever use the event loop's core
+        for mode, login, cores in [("inline", inline_login, 1), ("pool", pooled_login, min(args.workers, os.cpu_count() or 1))]:
+            result = {"rounds": rounds, "mode": mode, "cores": cores} | await measure(login, user, cores)
+            print(json.dumps(result))
+            results.append(result)
+    return results
+
+asyncio.run(main())
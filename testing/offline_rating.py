@@ -0,0 +1,66 @@
+import argparse
+import json
+
+from models import Job
+from utils.agents import ResumeRater, BatchResumeRater
+from utils.auth import supabase
+from utils.batch_rating import write_batch_requests, submit_batch, download_batch_results, ingest_batch_results
+from utils.rating_cache import rating_cache
+from utils.vector_db import get_vector_client
+
+# Nightly re-rating of whole talent pools through the OpenAI Batch API, e.g.:
+# python -m testing.offline_rating prepare --job-id JOB_ID --out requests.jsonl
+# python -m testing.offline_rating submit requests.jsonl
+# python -m testing.offline_rating download BATCH_ID --out results.jsonl
+# python -m testing.offline_rating ingest results.jsonl --requests requests.jsonl
+
+def iter_pool(collection_name: str):
+    offset = None
+    while True:
+        points, offset = get_vector_client().scroll(collection_name=collection_name, with_payload=True, with_vectors=False, limit=256, offset=offset)
+        yield from (point.payload | {"id": point.id} for point in points)
+        if offset is None:
+            break
+
+def prepare(args):
+    job = Job.init_job(**supabase.table("jobs").select("*").eq("job_id", args.job_id).execute().data[0])
+    resume_rater = BatchResumeRater(job.rating_schema, args.batch_size) if args.batch_size > 1 else ResumeRater(job.rating_schema)
+
+    # Resumes that already have a cached rating for this schema don't need re-rating
+    resume_list = list(iter_pool(args.collection))
+    cached = rating_cache.get_many([resume_rater.cache_key(resume["resume"]) for resume in resume_list])
+    resume_list = [resume for resume in resume_list if resume_rater.cache_key(resume["resume"]) not in cached]
+
+    n_requests = write_batch_requests(args.out, resume_list, resume_rater)
+    print(f"Wrote {n_requests} requests for {len(resume_list)} resumes to {args.out}")
+
+parser = argparse.ArgumentParser(description="Offline resume rating through the OpenAI Batch API")
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+prepare_parser = subparsers.add_parser("prepare", help="Write batch requests for every unrated resume in a pool")
+prepare_parser.add_argument("--job-id", required=True)
+prepare_parser.add_argument("--out", required=True)
+prepare_parser.add_argument("--collection", default="talent-pool")
+prepare_parser.add_argument("--batch-size", type=int, default=1, help="Resumes per request")
+
+submit_parser = subparsers.add_parser("submit", help="Upload a request file and start a batch")
+submit_parser.add_argument("requests")
+
+download_parser = subparsers.add_parser("download", help="Download the results of a completed batch")
+download_parser.add_argument("batch_id")
+download_parser.add_argument("--out", required=True)
+
+ingest_parser = subparsers.add_parser("ingest", help="Load batch results into the rating cache")
+ingest_parser.add_argument("results")
+ingest_parser.add_argument("--requests", required=True, help="The request file the batch was created from")
+
+args = parser.parse_args()
+
+if args.command == "prepare":
+    prepare(args)
+elif args.command == "submit":
+    print(submit_batch(args.requests))
+elif args.command == "download":
+    print(download_batch_results(args.batch_id, args.out))
+elif args.command == "ingest":
+    print(json.dumps(ingest_batch_results(args.results, args.requests, rating_cache), indent=4))
@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from utils import pdf
+from utils.env import env
+
+# Micro-benchmark of the PDF extraction backends (utils/pdf.py) on a corpus of sample PDFs, e.g.:
+# python -m testing.pdf_benchmark resumes/ --workers 1 4
+# Without paths, a corpus is generated from the test collection's resumes, which needs PyMuPDF;
+# --pages makes longer documents. Each backend is run serially and with every pool size, and its text is
+# compared with the PyPDF2 baseline's. Pools only split documents of PARALLEL_MIN_PAGES pages or more,
+# so e.g. --pages 20 shows their effect.
+
+parser = argparse.ArgumentParser(description="Benchmark PDF text extraction backends")
+parser.add_argument("paths", nargs="*", help="PDF files or directories of them")
+parser.add_argument("--backends", nargs="+", default=None, help="Defaults to every installed backend")
+parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Extraction pool sizes; 1 extracts serially")
+parser.add_argument("--generate", type=int, default=50, help="Documents to generate when no paths are given")
+parser.add_argument("--pages", type=int, default=2, help="Pages per generated document")
+parser.add_argument("--repeat", type=int, default=3, help="Timed passes over the corpus")
+parser.add_argument("--output", default="testing/pdf_benchmark_results.json")
+args = parser.parse_args()
+
+def generate_corpus(directory: Path, count: int, pages: int) -> list[Path]:
+    import pymupdf
+    with open("testing/clean_test_collection.json", "r") as f:
+        resumes = [resume["resume"] for job in json.load(f) for resume in job["resumes"]]
+    paths = []
+    for i in range(count):
+        document = pymupdf.open()
+        for page_number in range(pages):
+            page = document.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), resumes[(i + page_number) % len(resumes)], fontsize=8)
+        path = directory / f"resume_{i}.pdf"
+        document.save(path)
+        document.close()
+        paths.append(path)
+    return paths
+
+def similarity(text: str, baseline: str) -> float:
+    # Share of the baseline's words that the backend also found
+    words, baseline_words = set(text.split()), set(baseline.split())
+    return len(words & baseline_words) / len(baseline_words) if baseline_words else 1.0
+
+def run(backend: str, workers: int, documents: list[bytes], baseline: list[str] | None) -> tuple[dict, list[str]]:
+    # A fresh pool per configuration, created and warmed up outside the timed passes
+    pdf.get_extraction_pool.loaded = False
+    pdf.extraction_workers.loaded = False
+    env["PDF_EXTRACT_WORKERS"] = str(workers)
+    pool = pdf.get_extraction_pool()
+    if pool:
+        # Imports the backend in every pool process
+        extract_pages = pdf.BACKENDS[backend][0]
+        list(pool.map(extract_pages, [documents[0]] * workers * 2, [0] * workers * 2, [1] * workers * 2))
+
+    seconds = []
+    for _ in range(args.repeat):
+        for contents in documents:
+            start = time.perf_counter()
+            pdf.extract_text(contents, backend)
+            seconds.append(time.perf_counter() - start)
+    texts = [pdf.extract_text(contents, backend) for contents in documents]
+    if pool:
+        pool.shutdown()
+
+    pages = sum(min(pdf.BACKENDS[backend][0](contents, 0, 0)[0], pdf.MAX_PDF_PAGES) for contents in documents) * args.repeat
+    samples = np.array(seconds) * 1000
+    result = {
+        "backend": backend,
+        "workers": workers,
+        "documents": len(documents),
+        "pages_per_sec": round(pages / sum(seconds), 1),
+        "p50_ms": round(float(np.percentile(samples, 50)), 2),
+        "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        "mean_chars": round(sum(map(len, texts)) / len(texts)),
+    }
+    if baseline is not None:
+        result["word_overlap_with_pypdf2"] = round(float(np.mean([similarity(text, base) for text, base in zip(texts, baseline)])), 4)
+    return result, texts
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        if args.paths:
+            paths = [p for path in map(Path, args.paths) for p in (sorted(path.rglob("*.pdf")) if path.is_dir() else [path])]
+        else:
+            paths = generate_corpus(Path(directory), args.generate, args.pages)
+        documents = [path.read_bytes() for path in paths]
+
+    backends = args.backends or pdf.available_backends()
+    # PyPDF2 first, so the others can be compared with it
+    backends = sorted(backends, key=lambda backend: backend != "pypdf2")
+    results, baseline = [], None
+    for backend in backends:
+        for workers in args.workers:
+            result, texts = run(backend, workers, documents, baseline if backend != "pypdf2" else None)
+            if backend == "pypdf2" and baseline is None:
+                baseline = texts
+            print(json.dumps(result))
+            results.append(result)
+    json.dump({"args": vars(args), "cpu_count": os.cpu_count(), "results": results}, open(args.output, "w"), indent=4)
@@ -0,0 +1,136 @@
+import argparse
+import itertools
+import json
+import resource
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from utils.env import env
+from utils.vector_db import collection_config, estimated_ram_bytes
+
+# Recall vs latency vs memory of dense vector collection settings, e.g. against a local Qdrant server:
+# docker run -p 6333:6333 qdrant/qdrant
+# python -m testing.quantization_benchmark --url http://localhost:6333 --pool-sizes 100000 1000000 --on-disk
+# Each pool of synthetic, clustered unit vectors is loaded once per quantization mode, then searched with every
+# hnsw_ef and oversampling setting. recall@k is measured against exact nearest neighbours computed with numpy.
+# The default in-memory Qdrant (":memory:") always searches exhaustively and ignores HNSW and quantization,
+# so it only gives the exact-search baseline; the tradeoffs need a server.
+
+COLLECTION_NAME = "talent-pool-quantization-benchmark"
+
+parser = argparse.ArgumentParser(description="Benchmark recall@k, search latency and memory of quantized and on-disk collections")
+parser.add_argument("--url", default=env.get("QDRANT_BENCHMARK_URL") or ":memory:", help="Qdrant URL, or :memory:")
+parser.add_argument("--pool-sizes", type=int, nargs="+", default=[10000, 100000])
+parser.add_argument("--dim", type=int, default=768)
+parser.add_argument("--clusters", type=int, default=200, help="Clusters in the synthetic pool, standing in for resume topics")
+parser.add_argument("--quantization", nargs="+", choices=["none", "scalar", "binary"], default=["none", "scalar", "binary"])
+parser.add_argument("--on-disk", action="store_true", help="Keep original vectors and the HNSW graph on disk")
+parser.add_argument("--hnsw-m", type=int, default=16)
+parser.add_argument("--hnsw-ef-construct", type=int, default=100)
+parser.add_argument("--hnsw-ef", type=int, nargs="+", default=[64, 128, 256])
+parser.add_argument("--oversampling", type=float, nargs="+", default=[1.0, 2.0, 4.0], help="Only used with quantization")
+parser.add_argument("--k", type=int, default=10, help="Results per query, i.e. the prefetch_limit being tuned")
+parser.add_argument("--queries", type=int, default=200)
+parser.add_argument("--batch-size", type=int, default=1000, help="Upsert batch size")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", default="testing/quantization_benchmark_results.json")
+args = parser.parse_args()
+
+def synthetic_vectors(rng: np.random.Generator, centroids: np.ndarray, count: int) -> np.ndarray:
+    # Points scattered around random centroids, normalized like Jina's cosine embeddings
+    vectors = centroids[rng.integers(len(centroids), size=count)] + 0.5 * rng.standard_normal((count, centroids.shape[1]), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def exact_neighbours(pool: np.ndarray, queries: np.ndarray, k: int, chunk_size: int = 50000) -> list[set[int]]:
+    # Chunked, so large pools don't need a full queries x pool score matrix
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(pool), chunk_size):
+        chunk = pool[start:start + chunk_size]
+        scores = np.concatenate([best_scores, queries @ chunk.T], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(chunk)), (len(queries), len(chunk)))], axis=1)
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return [set(row.tolist()) for row in best_ids]
+
+def wait_for_indexing(client: QdrantClient, timeout: float = 3600) -> float:
+    # Searches only use the HNSW graph and quantized vectors once the optimizer has built them
+    start = time.perf_counter()
+    while client.get_collection(COLLECTION_NAME).status != models.CollectionStatus.GREEN:
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("Collection was not indexed in time")
+        time.sleep(1)
+    return time.perf_counter() - start
+
+def percentiles(seconds: list[float]) -> dict:
+    samples = np.array(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 2),
+        "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        "p99_ms": round(float(np.percentile(samples, 99)), 2),
+    }
+
+def search(client: QdrantClient, queries: np.ndarray, truth: list[set[int]], params: models.SearchParams) -> dict:
+    seconds, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        response = client.query_points(collection_name=COLLECTION_NAME, query=query.tolist(), using="jina", limit=args.k, search_params=params)
+        seconds.append(time.perf_counter() - start)
+        recalls.append(len(expected & {point.id for point in response.points}) / args.k)
+    return {f"recall@{args.k}": round(float(np.mean(recalls)), 4)} | percentiles(seconds)
+
+def benchmark_pool(client: QdrantClient, pool_size: int) -> list[dict]:
+    rng = np.random.default_rng(args.seed)
+    centroids = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    pool = synthetic_vectors(rng, centroids, pool_size)
+    queries = synthetic_vectors(rng, centroids, args.queries)
+    truth = exact_neighbours(pool, queries, args.k)
+
+    results = []
+    for quantization in args.quantization:
+        if client.collection_exists(COLLECTION_NAME):
+            client.delete_collection(COLLECTION_NAME)
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            **collection_config(args.dim, quantization, args.on_disk, args.hnsw_m, args.hnsw_ef_construct),
+        )
+
+        start = time.perf_counter()
+        client.upload_collection(collection_name=COLLECTION_NAME, vectors={"jina": pool}, ids=range(pool_size), batch_size=args.batch_size)
+        upload_seconds = time.perf_counter() - start
+        index_seconds = wait_for_indexing(client)
+
+        ram_mb = round(estimated_ram_bytes(pool_size, args.dim, quantization, args.on_disk, args.hnsw_m) / 2**20, 1)
+        oversampling_values = args.oversampling if quantization != "none" else [None]
+        for hnsw_ef, oversampling in itertools.product(args.hnsw_ef, oversampling_values):
+            params = models.SearchParams(
+                hnsw_ef=hnsw_ef,
+                quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling) if oversampling else None,
+            )
+            result = {
+                "pool_size": pool_size,
+                "quantization": quantization,
+                "on_disk": args.on_disk,
+                "hnsw_ef": hnsw_ef,
+                "oversampling": oversampling,
+                "upload_seconds": round(upload_seconds, 2),
+                "index_seconds": round(index_seconds, 2),
+                "estimated_vector_ram_mb": ram_mb,
+            } | search(client, queries, truth, params)
+            print(json.dumps(result))
+            results.append(result)
+
+    client.delete_collection(COLLECTION_NAME)
+    return results
+
+client = QdrantClient(location=args.url, api_key=env.get("QDRANT_API_KEY") if args.url != ":memory:" else None, timeout=600)
+if args.url == ":memory:":
+    print("In-memory Qdrant searches exhaustively: expect recall 1.0 and no effect from HNSW or quantization settings")
+
+results = [result for pool_size in args.pool_sizes for result in benchmark_pool(client, pool_size)]
+# ru_maxrss is in kilobytes on Linux. Against a server, the collections live in the server process instead.
+peak_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+json.dump({"args": vars(args), "peak_rss_mb": peak_rss_mb, "results": results}, open(args.output, "w"), indent=4)
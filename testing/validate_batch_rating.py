@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import uvicorn
+
+from utils.env import env
+
+# Checks the batched and offline rating modes against the local fake OpenAI server:
+# python -m testing.validate_batch_rating
+# Batched and offline ratings must match what one-resume-per-call rating returns.
+
+PORT = 8765
+env["OPENAI_API_KEY"] = env.get("OPENAI_API_KEY") or "fake-key"
+env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+
+from testing.fake_openai import app
+from utils.agents import ResumeRater, BatchResumeRater
+from utils.batch_rating import write_batch_requests, submit_batch, download_batch_results, ingest_batch_results
+from utils.rating_cache import RatingCache
+
+RATING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        category: {"type": "integer", "description": f"Rate the candidate's {category.replace('_', ' ')} skills on a scale of 1 to 10."}
+        for category in ["python", "machine_learning", "solidworks", "structural_analysis"]
+    },
+    "required": ["python", "machine_learning", "solidworks", "structural_analysis"],
+    "additionalProperties": False
+}
+
+def start_fake_server() -> None:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+def load_resumes() -> list[dict]:
+    with open("testing/clean_test_collection.json", "r") as f:
+        data = json.load(f)
+    resumes = {resume["id"]: resume for job in data for resume in job["resumes"]}
+    return list(resumes.values())
+
+async def rate_online(resume_list: list[dict], resume_rater: ResumeRater) -> dict[str, dict]:
+    ratings = {}
+    for start in range(0, len(resume_list), resume_rater.batch_size):
+        batch = resume_list[start:start + resume_rater.batch_size]
+        ratings |= await resume_rater.respond_batch({resume["id"]: resume["resume"] for resume in batch})
+    return ratings
+
+def rate_offline(resume_list: list[dict], resume_rater: ResumeRater) -> dict[str, dict]:
+    cache = RatingCache(":memory:")
+    with tempfile.TemporaryDirectory() as tmp:
+        requests_path = os.path.join(tmp, "requests.jsonl")
+        results_path = os.path.join(tmp, "results.jsonl")
+        write_batch_requests(requests_path, resume_list, resume_rater)
+        batch_id = submit_batch(requests_path)
+        assert download_batch_results(batch_id, results_path) == "completed"
+        stats = ingest_batch_results(results_path, requests_path, cache)
+        assert stats["failed"] == 0, stats
+    keys = {resume["id"]: resume_rater.cache_key(resume["resume"]) for resume in resume_list}
+    cached = cache.get_many(list(keys.values()))
+    return {resume_id: cached[key] for resume_id, key in keys.items() if key in cached}
+
+async def main():
+    start_fake_server()
+    resume_list = load_resumes()
+
+    expected = await rate_online(resume_list, ResumeRater(RATING_SCHEMA))
+    assert len(expected) == len(resume_list)
+    print(f"Single: rated {len(expected)} resumes in {len(resume_list)} calls")
+
+    batch_rater = BatchResumeRater(RATING_SCHEMA, batch_size=5)
+    batched = await rate_online(resume_list, batch_rater)
+    assert batched == expected, "Batched ratings differ from single ratings"
+    print(f"Batched: rated {len(batched)} resumes in {-(-len(resume_list) // batch_rater.batch_size)} calls")
+
+    for resume_rater in [ResumeRater(RATING_SCHEMA), batch_rater]:
+        offline = rate_offline(resume_list, resume_rater)
+        assert offline == expected, "Offline ratings differ from single ratings"
+        print(f"Offline (batch size {resume_rater.batch_size}): rated {len(offline)} resumes")
+
+    print("OK")
+
+asyncio.run(main())
@@ -0,0 +1,70 @@
+import pytest
+
+from utils.env import env
+
+# Without MATCH_STORE_PATH, importing utils.match_store connects to Supabase
+env.setdefault("MATCH_STORE_PATH", ":memory:")
+
+from models import CandidateMatch
+from utils.match_store import SQLiteMatchRepository
+
+def make_match(job_id: str, candidate_id: str, score: float = 1.0, resume_version: int | None = None) -> CandidateMatch:
+    return CandidateMatch(job_id=job_id, candidate_id=candidate_id, resume="resume", score=score, name=candidate_id, ratings={"skill": score}, resume_version=resume_version)
+
+def candidate_ids(repository: SQLiteMatchRepository, job_id: str) -> list[str]:
+    return sorted(match.candidate_id for match in repository.get_matches(job_id))
+
+@pytest.fixture
+def repository(tmp_path) -> SQLiteMatchRepository:
+    return SQLiteMatchRepository(str(tmp_path / "matches.db"))
+
+def test_replace_matches_replaces_ranking(repository):
+    repository.replace_matches(["job"], [make_match("job", "a", 1), make_match("job", "b", 2)])
+    generation = repository.replace_matches(["job"], [make_match("job", "b", 5), make_match("job", "c", 3)])
+
+    matches = repository.get_matches("job")
+    assert [match.candidate_id for match in matches] == ["b", "c"]
+    assert matches[0].score == 5
+    assert all(match.generation == generation for match in matches)
+
+def test_replace_matches_only_touches_given_jobs(repository):
+    repository.replace_matches(["job", "other"], [make_match("job", "a"), make_match("other", "a")])
+    repository.replace_matches(["job"], [])
+
+    assert candidate_ids(repository, "job") == []
+    assert candidate_ids(repository, "other") == ["a"]
+
+def test_replace_matches_keeps_unrated_candidates(repository):
+    repository.replace_matches(["job"], [make_match("job", "a"), make_match("job", "b"), make_match("job", "c")])
+    repository.replace_matches(["job"], [make_match("job", "a", 4)], keep={"job": {"b"}})
+
+    assert candidate_ids(repository, "job") == ["a", "b"]
+
+def test_delete_stale_keeps_newer_rows(repository):
+    old_generation = repository.new_generation()
+    repository.upsert_matches([make_match("job", "a").model_copy(update={"generation": old_generation})])
+    new_generation = repository.replace_matches(["job"], [make_match("job", "b")])
+
+    # A slower refresh that started earlier must not delete the newer refresh's rows
+    repository.delete_stale(["job"], old_generation)
+    assert candidate_ids(repository, "job") == ["b"]
+
+    repository.upsert_matches([make_match("job", "c").model_copy(update={"generation": old_generation})])
+    repository.delete_stale(["job"], new_generation, keep={"job": {"c"}})
+    assert candidate_ids(repository, "job") == ["b", "c"]
+    repository.delete_stale(["job"], new_generation)
+    assert candidate_ids(repository, "job") == ["b"]
+
+def test_delete_outdated_resume(repository):
+    repository.replace_matches(
+        ["job", "other"],
+        [make_match("job", "a", resume_version=1), make_match("other", "a", resume_version=2), make_match("job", "b"), make_match("other", "c")],
+    )
+    repository.delete_outdated_resume("a", 2)
+
+    assert candidate_ids(repository, "job") == ["b"]
+    assert candidate_ids(repository, "other") == ["a", "c"]
+
+    # Rows from before resume versions existed are outdated too
+    repository.delete_outdated_resume("b", 1)
+    assert candidate_ids(repository, "job") == []
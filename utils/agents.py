@@ -1,35 +1,126 @@
+import asyncio
+import httpx
+import json
+import random
 import yaml
-from openai import OpenAI
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, APIConnectionError, InternalServerError, RateLimitError
 
+from utils.cache import TTLCache
 from utils.env import env
+from utils.metrics import llm_retries, llm_tokens
+from utils.rating_cache import RatingCache
+from utils.request_context import request_id
+from utils.tracing import span
 
 with open("llm_config.yaml", "r") as file:
     model_config = yaml.safe_load(file)
 
+# Errors worth retrying: 429s, 5xx responses, timeouts and dropped connections
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # Exponential backoff with full jitter, so concurrent callers don't retry in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+async def with_retries(call: Callable[[], Awaitable], max_retries: int, backoff_base: float, backoff_cap: float, attributes: dict | None = None):
+    # attributes, if given, are a trace span's attributes and get the number of retries
+    for attempt in range(max_retries + 1):
+        try:
+            return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            llm_retries.inc(error=type(e).__name__)
+            if attributes is not None:
+                attributes["retries"] = attempt + 1
+            await asyncio.sleep(backoff_delay(attempt, backoff_base, backoff_cap))
+
+def record_usage(completion, model: str, attributes: dict) -> None:
+    usage = completion.usage
+    if usage is None:
+        return
+    attributes["prompt_tokens"] = usage.prompt_tokens
+    attributes["completion_tokens"] = usage.completion_tokens
+    llm_tokens.inc(usage.prompt_tokens, model=model, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens, model=model, kind="completion")
+
+def request_headers() -> dict[str, str] | None:
+    # Forwards the current request id, so LLM calls can be matched to the request that made them
+    current_id = request_id.get()
+    return {"X-Request-ID": current_id} if current_id else None
+
+# One client, and therefore one HTTP connection pool, shared by every agent in the process.
+# Retries are handled by with_retries so that they use jittered backoff.
+client_config = model_config.get("http_client", {})
+openai_client = AsyncOpenAI(
+    api_key=env["OPENAI_API_KEY"],
+    base_url=env.get("OPENAI_BASE_URL"),
+    max_retries=0,
+    http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+        max_connections=client_config.get("max_connections", 100),
+        max_keepalive_connections=client_config.get("max_keepalive_connections", 20),
+    )),
+)
+
 class SchemaMakerAgent:
-    def __init__(self):
-        self.model = model_config["schema_maker"]["model"]
-        self.system_message = model_config["schema_maker"]["system_message"]
-        self.client = OpenAI(api_key=env["OPENAI_API_KEY"])
-        self.messages = [{"role": "system", "content": self.system_message}]
-
-    def respond(self, query: str) -> str:
-        self.messages.append({"role": "user", "content": query})
-        completion = self.client.chat.completions.create(
-            messages=self.messages,
-            model=self.model,
-            response_format={"type": "json_object"}
-        )
+    # Stateless by default: every job description is sent on its own. With history_size > 0, the most
+    # recent exchanges are kept as bounded few-shot context, separately per history_key (e.g. per user),
+    # so a shared instance never shows one caller's job descriptions to another.
+    def __init__(self, history_size: int | None = None):
+        maker_config = model_config["schema_maker"]
+        self.model = maker_config["model"]
+        self.system_message = maker_config["system_message"]
+        self.timeout = maker_config.get("timeout", 60)
+        self.max_retries = maker_config.get("max_retries", 3)
+        self.backoff_base = maker_config.get("backoff_base", 0.5)
+        self.backoff_cap = maker_config.get("backoff_cap", 8)
+        self.client = openai_client
+        self.history_size = history_size if history_size is not None else maker_config.get("history_size", 0)
+        # Histories of idle keys expire, so they don't accumulate for every user ever seen
+        self.histories = TTLCache(maxsize=maker_config.get("max_histories", 10_000), ttl=maker_config.get("history_ttl", 3600))
+
+    async def respond(self, query: str, history_key: Hashable | None = None) -> str:
+        history = self.histories.get(history_key) if self.history_size else None
+        messages = [{"role": "system", "content": self.system_message}]
+        for past_query, past_response in list(history or ()):
+            messages += [{"role": "user", "content": past_query}, {"role": "assistant", "content": past_response}]
+        messages.append({"role": "user", "content": query})
+
+        with span("llm_call", agent="schema_maker", model=self.model) as attributes:
+            completion = await with_retries(
+                lambda: self.client.chat.completions.create(
+                    messages=messages,
+                    model=self.model,
+                    response_format={"type": "json_object"},
+                    timeout=self.timeout,
+                    extra_headers=request_headers(),
+                ),
+                self.max_retries, self.backoff_base, self.backoff_cap, attributes
+            )
+            record_usage(completion, self.model, attributes)
         response = completion.choices[0].message.content
-        self.messages.append({"role": "assistant", "content": response})
+        if self.history_size:
+            history = history if history is not None else deque(maxlen=self.history_size)
+            history.append((query, response))
+            self.histories.set(history_key, history)
         return response
     
 
 class ResumeRater:
+    batch_size = 1
+
     def __init__(self, schema: dict):
-        self.model = model_config["resume_rater"]["model"]
-        self.system_message = model_config["resume_rater"]["system_message"]
-        self.client = OpenAI(api_key=env["OPENAI_API_KEY"])
+        rater_config = model_config["resume_rater"]
+        self.model = rater_config["model"]
+        self.system_message = rater_config["system_message"]
+        self.timeout = rater_config.get("timeout", 30)
+        self.max_retries = rater_config.get("max_retries", 3)
+        self.backoff_base = rater_config.get("backoff_base", 0.5)
+        self.backoff_cap = rater_config.get("backoff_cap", 8)
+        self.client = openai_client
+        self.schema = schema
         self.rating_schema = {
             "type": "json_schema",
             "json_schema": {
@@ -39,13 +130,96 @@ class ResumeRater:
             }
         }
 
-    def respond(self, query: str):
-        completion = self.client.beta.chat.completions.parse(
-            model=self.model,
-            messages=[
+    def cache_key(self, query: str) -> str:
+        return RatingCache.make_key(query, self.schema, self.model, self.system_message)
+
+    def request_body(self, query: str) -> dict:
+        # Chat completion request for one resume, shared by online calls and offline batch files
+        return {
+            "model": self.model,
+            "messages": [
                 {"role": "system", "content": self.system_message},
                 {"role": "user", "content": query}
             ],
-            response_format=self.rating_schema,
-        )
-        return completion.choices[0].message.content
\ No newline at end of file
+            "response_format": self.rating_schema,
+        }
+
+    async def complete(self, body: dict) -> str:
+        with span("llm_call", agent="resume_rater", model=self.model) as attributes:
+            completion = await with_retries(
+                lambda: self.client.beta.chat.completions.parse(**body, timeout=self.timeout, extra_headers=request_headers()),
+                self.max_retries, self.backoff_base, self.backoff_cap, attributes
+            )
+            record_usage(completion, self.model, attributes)
+        return completion.choices[0].message.content
+
+    async def respond(self, query: str) -> str:
+        return await self.complete(self.request_body(query))
+
+    async def respond_batch(self, resumes: dict[str, str]) -> dict[str, dict]:
+        # Ratings by candidate id, one call per resume; BatchResumeRater rates them all in one call
+        return {candidate_id: json.loads(await self.respond(resume)) for candidate_id, resume in resumes.items()}
+
+
+def batch_rating_schema(schema: dict) -> dict:
+    # Wraps a rating schema into an array of ratings, one per candidate, each tagged with its candidate id
+    return {
+        "type": "object",
+        "properties": {
+            "ratings": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"candidate_id": {"type": "string"}} | schema["properties"],
+                    "required": ["candidate_id", *schema["properties"].keys()],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["ratings"],
+        "additionalProperties": False
+    }
+
+class BatchResumeRater(ResumeRater):
+    # Rates several resumes per call, so the system prompt and per-request overhead are paid once per batch
+
+    def __init__(self, schema: dict, batch_size: int | None = None):
+        super().__init__(schema)
+        self.batch_size = batch_size or model_config["resume_rater"].get("batch_size", 5)
+        self.batch_instructions = model_config["resume_rater"]["batch_instructions"]
+        self.batch_rating_schema = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "resume_batch_rating_schema",
+                "strict": True,
+                "schema": batch_rating_schema(schema)
+            }
+        }
+
+    def cache_key(self, query: str) -> str:
+        # Ratings made with the batch prompt are cached apart from single-resume ones
+        return RatingCache.make_key(query, self.schema, self.model, f"{self.system_message}\n{self.batch_instructions}")
+
+    def batch_request_body(self, resumes: dict[str, str]) -> dict:
+        candidates = "\n\n".join(f'<candidate id="{candidate_id}">\n{resume}\n</candidate>' for candidate_id, resume in resumes.items())
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": f"{self.system_message}\n{self.batch_instructions}"},
+                {"role": "user", "content": candidates}
+            ],
+            "response_format": self.batch_rating_schema,
+        }
+
+    @staticmethod
+    def parse_batch_response(response: str) -> dict[str, dict]:
+        ratings = {}
+        for item in json.loads(response)["ratings"]:
+            candidate_id = item.pop("candidate_id")
+            ratings[candidate_id] = item
+        return ratings
+
+    async def respond_batch(self, resumes: dict[str, str]) -> dict[str, dict]:
+        # Ratings by candidate id; candidates the model left out are missing from the result
+        response = await self.complete(self.batch_request_body(resumes))
+        return self.parse_batch_response(response)
@@ -1,39 +1,110 @@
+import asyncio
 import jwt
-from typing import Annotated
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Callable
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from supabase import create_client, Client
 from utils.env import env
+from utils.cache import TTLCache
+from utils.request_context import request_memo
 from models import TokenData, UserInDB, User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor of new hashes. Raising it upgrades existing hashes as their users log in.
+BCRYPT_ROUNDS = int(env.get("BCRYPT_ROUNDS") or 12)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# bcrypt releases the GIL, so hashing runs in parallel on these threads instead of blocking the event loop.
+# Bounded to PASSWORD_HASH_WORKERS threads, so a login storm can't take every core from the other endpoints.
+password_pool = ThreadPoolExecutor(
+    max_workers=int(env.get("PASSWORD_HASH_WORKERS") or os.cpu_count() or 1),
+    thread_name_prefix="password-hash",
+)
+
 SECRET_KEY = env["JWT_SECRET"]
 ALGORITHM = env["JWT_ALGO"]
 url: str = env["SUPABASE_URL"]
 key: str = env["SUPABASE_KEY"]
 supabase: Client = create_client(url, key)
 
+# Authenticated users by email, so most requests skip the Supabase round trip
+user_cache = TTLCache(
+    maxsize=int(env.get("USER_CACHE_SIZE") or 10_000),
+    ttl=float(env.get("USER_CACHE_TTL") or 60),
+)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def hash_rounds(hashed_password: str) -> int:
+    # Cost factor of a bcrypt hash, e.g. 12 for "$2b$12$..."
+    return int(hashed_password.split("$")[2])
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    # Whether the password matches, and a new hash if the stored one is cheaper than BCRYPT_ROUNDS.
+    # Hashes are only ever upgraded, so lowering BCRYPT_ROUNDS (e.g. in tests) doesn't churn stored hashes.
+    if not verify_password(plain_password, hashed_password):
+        return False, None
+    if hash_rounds(hashed_password) < BCRYPT_ROUNDS:
+        return True, get_password_hash(plain_password)
+    return True, None
+
+async def run_in_password_pool(fn: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(password_pool, fn, *args)
+
+async def hash_password(password: str) -> str:
+    return await run_in_password_pool(get_password_hash, password)
+
+
+def get_user(email: str) -> UserInDB | None:
+    # Memoized for the current request, then cached across requests for up to USER_CACHE_TTL seconds
+    memo = request_memo.get()
+    if memo is not None and ("user", email) in memo:
+        return memo[("user", email)]
+
+    user = user_cache.get(email)
+    if user is None:
+        response = supabase.table("users").select("*").eq("email", email).execute()
+        user = UserInDB(**response.data[0]) if response.data else None
+        if user is not None:
+            user_cache.set(email, user)
+
+    if memo is not None:
+        memo[("user", email)] = user
+    return user
+
+def invalidate_user(email: str) -> None:
+    # Call whenever a user's row changes, so the change is visible on their next request
+    user_cache.invalidate(email)
+    memo = request_memo.get()
+    if memo is not None:
+        memo.pop(("user", email), None)
 
-def get_user(email: str):
-    response = supabase.table("users").select("*").eq("email", email).execute()
-    return UserInDB(**response.data[0])
+def update_password_hash(email: str, hashed_password: str) -> None:
+    supabase.table("users").update({"hashed_password": hashed_password}).eq("email", email).execute()
+    invalidate_user(email)
 
-def authenticate_user(email: str, password: str):
-    user = get_user(email)
+async def authenticate_user(email: str, password: str) -> UserInDB | bool:
+    # Nothing here blocks the event loop: the Supabase lookup runs in a thread and bcrypt in the password pool
+    user = await asyncio.to_thread(get_user, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await run_in_password_pool(verify_and_update_password, password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Transparent cost upgrade; the login succeeds even if saving the new hash fails
+        try:
+            await asyncio.to_thread(update_password_hash, email, new_hash)
+        except Exception as e:
+            print(f"Error upgrading password hash for {email}: {e}")
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -0,0 +1,83 @@
+import json
+from openai import OpenAI
+
+from utils.agents import ResumeRater
+from utils.env import env
+from utils.rating_cache import RatingCache
+
+# Offline rating through the OpenAI Batch API, for re-rating whole talent pools overnight.
+# Requests are written to a JSONL file, alongside a keys file that maps each request to the
+# rating cache keys of the resumes in it. Once the batch has finished, its results are ingested
+# into the rating cache, so later matches against those pools make no LLM calls.
+
+def write_batch_requests(path: str, resume_list: list[dict], resume_rater: ResumeRater) -> int:
+    keys = {}
+    with open(path, "w") as f:
+        for start in range(0, len(resume_list), resume_rater.batch_size):
+            batch = resume_list[start:start + resume_rater.batch_size]
+            custom_id = f"request-{start // resume_rater.batch_size}"
+            if resume_rater.batch_size == 1:
+                body = resume_rater.request_body(batch[0]["resume"])
+            else:
+                body = resume_rater.batch_request_body({str(resume["id"]): resume["resume"] for resume in batch})
+            keys[custom_id] = {str(resume["id"]): resume_rater.cache_key(resume["resume"]) for resume in batch}
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}) + "\n")
+
+    with open(keys_path(path), "w") as f:
+        json.dump(keys, f)
+    return len(keys)
+
+def keys_path(requests_path: str) -> str:
+    return f"{requests_path}.keys.json"
+
+def parse_batch_result(line: dict, candidate_keys: dict[str, str]) -> dict[str, dict]:
+    # Ratings by cache key for one result line, whether it came from a single or a batched request
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        return {}
+    try:
+        content = json.loads(response["body"]["choices"][0]["message"]["content"])
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError):
+        return {}
+    if "ratings" in content and isinstance(content["ratings"], list):
+        ratings = {str(item.pop("candidate_id")): item for item in content["ratings"]}
+    else:
+        ratings = {next(iter(candidate_keys)): content}
+    return {candidate_keys[candidate_id]: rating for candidate_id, rating in ratings.items() if candidate_id in candidate_keys}
+
+def ingest_batch_results(results_path: str, requests_path: str, cache: RatingCache) -> dict:
+    with open(keys_path(requests_path), "r") as f:
+        keys = json.load(f)
+
+    ratings = {}
+    failed = 0
+    with open(results_path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            parsed = parse_batch_result(result, keys.get(result["custom_id"], {}))
+            failed += len(keys.get(result["custom_id"], {})) - len(parsed)
+            ratings.update(parsed)
+
+    cache.set_many(ratings)
+    return {"ratings": len(ratings), "failed": failed}
+
+def batch_client() -> OpenAI:
+    return OpenAI(api_key=env["OPENAI_API_KEY"], base_url=env.get("OPENAI_BASE_URL"))
+
+def submit_batch(requests_path: str) -> str:
+    client = batch_client()
+    with open(requests_path, "rb") as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    return batch.id
+
+def download_batch_results(batch_id: str, results_path: str) -> str:
+    # Returns the batch status; results are only written once the batch has completed
+    client = batch_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status == "completed" and batch.output_file_id:
+        with open(results_path, "wb") as f:
+            f.write(client.files.content(batch.output_file_id).read())
+    return batch.status
@@ -0,0 +1,102 @@
+import re
+from uuid import NAMESPACE_URL, uuid5
+
+from qdrant_client import QdrantClient, models
+from qdrant_client.models import PointStruct
+
+from utils.embedding import build_qdrant_vectors
+from utils.env import env
+
+# Section-level chunks of resumes, stored as points of their own in a separate collection, grouped by
+# the resume's point id in "candidate_id". Whole-resume vectors lose most of a long resume: fastembed
+# truncates Jina's input at 512 tokens, and BM42's weights are diluted across every term.
+# Ingestion writes chunks when RESUME_CHUNKS is enabled; jobs search them with MatchingConfig.retrieval_unit.
+
+CHUNK_COLLECTION = env.get("CHUNK_COLLECTION") or "talent-pool-chunks"
+# Comfortably under the 512 token limit
+MAX_CHUNK_CHARS = 1500
+
+SECTION_HEADINGS = {
+    "summary": ["summary", "professional summary", "profile", "objective", "about me"],
+    "experience": ["experience", "work experience", "professional experience", "employment", "employment history", "work history"],
+    "education": ["education", "academic background"],
+    "skills": ["skills", "technical skills", "core competencies", "competencies", "technologies", "tools"],
+    "projects": ["projects", "personal projects", "selected projects"],
+    "certifications": ["certifications", "certificates", "licenses", "awards", "achievements"],
+    "publications": ["publications", "research"],
+    "activities": ["activities", "volunteering", "volunteer experience", "leadership", "interests"],
+}
+HEADING_SECTIONS = {heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings}
+# A heading is a short line on its own, optionally followed by a colon
+HEADING_PATTERN = re.compile(r"^\s*([A-Za-z][A-Za-z &/]{1,40}?)\s*:?\s*$")
+
+def chunks_enabled() -> bool:
+    return (env.get("RESUME_CHUNKS") or "").lower() in ("1", "true")
+
+def section_of(line: str) -> str | None:
+    match = HEADING_PATTERN.match(line)
+    return HEADING_SECTIONS.get(match.group(1).lower()) if match else None
+
+def split_long(text: str, max_chars: int) -> list[str]:
+    # Splits on line boundaries, and hard-splits any single line that is still too long
+    pieces, current = [], ""
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current.strip():
+        pieces.append(current)
+    return pieces
+
+def split_sections(text: str, max_chars: int = MAX_CHUNK_CHARS) -> list[dict]:
+    # Returns {"section", "chunk"} dicts in resume order. Text before the first heading (usually the name and
+    # contact details) is the "header" section. Each chunk starts with its section's name, so a chunk of a long
+    # experience section still says what it is.
+    sections, section, lines = [], "header", []
+    for line in text.splitlines():
+        heading = section_of(line)
+        if heading:
+            sections.append((section, "\n".join(lines)))
+            section, lines = heading, []
+        else:
+            lines.append(line)
+    sections.append((section, "\n".join(lines)))
+
+    chunks = []
+    for section, body in sections:
+        if not body.strip():
+            continue
+        for piece in split_long(body.strip(), max_chars - len(section) - 1):
+            chunks.append({"section": section, "chunk": f"{section}\n{piece}"})
+    return chunks
+
+def chunk_point_id(candidate_id: str, index: int) -> str:
+    return str(uuid5(NAMESPACE_URL, f"{candidate_id}:chunk:{index}"))
+
+def build_chunk_points(payloads: list[dict], batch_size: int = 32, parallel: int | None = None) -> list[PointStruct]:
+    # payloads are resume payloads with their point "id". Chunk payloads carry the resume's structured
+    # fields (for job filters) but not its full text.
+    chunk_payloads = []
+    for payload in payloads:
+        fields = {key: value for key, value in payload.items() if key not in ("id", "resume")}
+        for index, chunk in enumerate(split_sections(payload["resume"])):
+            chunk_payloads.append(fields | chunk | {"candidate_id": str(payload["id"]), "chunk_index": index})
+    vectors = build_qdrant_vectors([chunk["chunk"] for chunk in chunk_payloads], batch_size=batch_size, parallel=parallel)
+    return [
+        PointStruct(id=chunk_point_id(chunk["candidate_id"], chunk["chunk_index"]), vector=vector, payload=chunk)
+        for chunk, vector in zip(chunk_payloads, vectors)
+    ]
+
+def replace_chunks(vector_client: QdrantClient, points: list[PointStruct], collection_name: str = CHUNK_COLLECTION) -> None:
+    # Removes the candidates' previous chunks first, since a re-uploaded resume may have fewer of them
+    candidate_ids = list({point.payload["candidate_id"] for point in points})
+    if candidate_ids:
+        vector_client.delete(
+            collection_name=collection_name,
+            points_selector=models.Filter(must=[models.FieldCondition(key="candidate_id", match=models.MatchAny(any=candidate_ids))]),
+        )
+    vector_client.upsert(collection_name=collection_name, points=points)
@@ -1,10 +1,40 @@
-from fastembed import SparseTextEmbedding, TextEmbedding
+import itertools
+from typing import Iterable, Iterator
 from qdrant_client.models import SparseVector
-model_bm42 = SparseTextEmbedding(model_name="Qdrant/bm42-all-minilm-l6-v2-attentions")
-model_jina = TextEmbedding(model_name="jinaai/jina-embeddings-v2-base-en")
+
+from utils.env import env
+from utils.lazy import Lazy
+from utils.tracing import span
+
+# Models are loaded on first use, so processes that never embed (e.g. workers only serving auth)
+# don't pay the load time and memory. fastembed is imported inside the loaders for the same reason.
+
+@Lazy
+def get_bm42_model():
+    from fastembed import SparseTextEmbedding
+    return SparseTextEmbedding(model_name="Qdrant/bm42-all-minilm-l6-v2-attentions")
+
+@Lazy
+def get_jina_model():
+    from fastembed import TextEmbedding
+    return TextEmbedding(model_name="jinaai/jina-embeddings-v2-base-en")
+
+@Lazy
+def get_embedding_client():
+    # With EMBEDDING_SERVER set (a Unix socket path or host:port), BM42 and Jina embeddings come from the
+    # shared server started by embedding_server.py, so this process never loads the models itself
+    if not env.get("EMBEDDING_SERVER"):
+        return None
+    from utils.embedding_service import EmbeddingClient
+    return EmbeddingClient(env["EMBEDDING_SERVER"])
+
+# bm42_embed and jina_embed are for callers that need one model only. The embedding server always computes
+# both, so callers that need both should use embed_queries, which gets them from a single call.
 
 def bm42_embed(text: str) -> list[float]:
-    embeddings = list(model_bm42.query_embed(text))[0]
+    if client := get_embedding_client():
+        return client.embed_queries([text])[0][0]
+    embeddings = list(get_bm42_model().query_embed(text))[0]
     if hasattr(embeddings, 'indices') and hasattr(embeddings, 'values'):
         sparse_vector = SparseVector(
             indices=embeddings.indices.tolist(),
@@ -15,9 +45,68 @@ def bm42_embed(text: str) -> list[float]:
         raise ValueError("The embeddings object does not have 'indices' and 'values' attributes.")
 
 def jina_embed(text: str) -> list[float]:
-    return list(model_jina.query_embed(text))[0].tolist()
+    if client := get_embedding_client():
+        return client.embed_queries([text])[0][1]
+    return list(get_jina_model().query_embed(text))[0].tolist()
+
+def embed_queries(texts: list[str]) -> list[tuple[SparseVector, list[float]]]:
+    # Query-side embeddings for several texts, one batched call per model
+    with span("embed_queries", texts=len(texts)):
+        if client := get_embedding_client():
+            return client.embed_queries(texts)
+        return local_embed_queries(texts)
+
+def local_embed_queries(texts: list[str]) -> list[tuple[SparseVector, list[float]]]:
+    sparse_embeddings = get_bm42_model().query_embed(texts)
+    dense_embeddings = get_jina_model().query_embed(texts)
+    return [
+        (SparseVector(indices=sparse.indices.tolist(), values=sparse.values.tolist()), dense.tolist())
+        for sparse, dense in zip(sparse_embeddings, dense_embeddings)
+    ]
+
+def embed_passages(texts: Iterable[str], batch_size: int = 32, parallel: int | None = None) -> Iterator[dict]:
+    # Document-side embeddings for a stream of texts, in input order.
+    # Runs on the embedding server when one is configured, unless local worker processes are asked for.
+    client = get_embedding_client()
+    if client and parallel is None:
+        texts = iter(texts)
+        while batch := list(itertools.islice(texts, batch_size)):
+            yield from client.embed_passages(batch)
+        return
+    yield from local_embed_passages(texts, batch_size, parallel)
+
+def local_embed_passages(texts: Iterable[str], batch_size: int = 32, parallel: int | None = None) -> Iterator[dict]:
+    # Both models consume the same stream, so their batches (and worker pools, when parallel
+    # is set) stay alive for the whole stream instead of being rebuilt for every text.
+    bm42_texts, jina_texts = itertools.tee(texts)
+    sparse_embeddings = get_bm42_model().passage_embed(bm42_texts, batch_size=batch_size, parallel=parallel)
+    dense_embeddings = get_jina_model().passage_embed(jina_texts, batch_size=batch_size, parallel=parallel)
+    for sparse, dense in zip(sparse_embeddings, dense_embeddings):
+        yield {
+            "bm42": SparseVector(indices=sparse.indices.tolist(), values=sparse.values.tolist()),
+            "jina": dense.tolist()
+        }
+
+def build_qdrant_vectors(texts: list[str], batch_size: int = 32, parallel: int | None = None) -> list[dict]:
+    with span("embed_passages", texts=len(texts)):
+        return list(embed_passages(texts, batch_size=batch_size, parallel=parallel))
 
 def build_qdrant_vector(text: str) -> dict:
-    bm42_vec = bm42_embed(text)
-    jina_vec = jina_embed(text)
-    return {"bm42": bm42_vec, "jina": jina_vec}
\ No newline at end of file
+    return build_qdrant_vectors([text])[0]
+
+
+@Lazy
+def get_reranker():
+    # Only loaded by jobs that use the cross-encoder re-ranker
+    from fastembed.rerank.cross_encoder import TextCrossEncoder
+    return TextCrossEncoder(model_name="Xenova/ms-marco-MiniLM-L-6-v2")
+
+def rerank_scores(query: str, documents: list[str]) -> list[float]:
+    with span("cross_encoder_rerank", documents=len(documents)):
+        return list(get_reranker().rerank(query, documents))
+
+def warm_up(reranker: bool = False) -> None:
+    # Loads the models (or connects to the embedding server) and runs them once, so the first request doesn't pay for it
+    embed_queries(["warm up"])
+    if reranker:
+        rerank_scores("warm up", ["warm up"])
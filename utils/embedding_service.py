@@ -0,0 +1,163 @@
+import asyncio
+import json
+import socket
+import struct
+import threading
+from typing import Callable
+
+from qdrant_client.models import SparseVector
+
+# Protocol and client of the shared embedding server (embedding_server.py).
+# Messages are JSON objects, each prefixed with its length as a 4-byte big-endian integer.
+# Requests: {"id": int, "op": "query" | "passage", "texts": [str]} or {"id": int, "op": "stats"}
+# Responses: {"id": int, "embeddings": [{"bm42": {"indices": [...], "values": [...]}, "jina": [...]}]},
+# {"id": int, "stats": {...}} or {"id": int, "error": str}
+# Addresses are a Unix socket path, or host:port for TCP.
+
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+def encode_message(message: dict) -> bytes:
+    body = json.dumps(message).encode()
+    return HEADER.pack(len(body)) + body
+
+def parse_address(address: str) -> tuple[str, int] | str:
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and not address.startswith("/"):
+        return host, int(port)
+    return address
+
+async def read_message(reader: asyncio.StreamReader) -> dict:
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {size} bytes is too large")
+    return json.loads(await reader.readexactly(size))
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        buffer += chunk
+    return bytes(buffer)
+
+def recv_message(sock: socket.socket) -> dict:
+    (size,) = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    return json.loads(recv_exactly(sock, size))
+
+def to_wire(sparse: SparseVector, dense: list[float]) -> dict:
+    return {"bm42": {"indices": sparse.indices, "values": sparse.values}, "jina": dense}
+
+class MicroBatcher:
+    # Server side: collects the texts of concurrent requests into batches of up to max_batch_size texts,
+    # waiting at most max_wait seconds for a batch to fill, and runs each batch through embed in a thread.
+    def __init__(self, embed: Callable[[list[str]], list], max_batch_size: int, max_wait: float):
+        self.embed = embed
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue[tuple[list[str], asyncio.Future]] = asyncio.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    async def submit(self, texts: list[str]) -> list:
+        # Requests larger than a batch are split, so one big request can't hold up the others for long
+        futures = []
+        for start in range(0, len(texts), self.max_batch_size):
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((texts[start:start + self.max_batch_size], future))
+            futures.append(future)
+        return [embedding for chunk in await asyncio.gather(*futures) for embedding in chunk]
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            size = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size and (timeout := deadline - loop.time()) > 0:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in items for text in item_texts]
+            try:
+                embeddings = await asyncio.to_thread(self.embed, texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "texts": self.texts, "mean_batch_size": self.texts / self.batches if self.batches else 0.0}
+
+class EmbeddingClient:
+    # Blocking client with one connection per thread, since embedding calls run in worker threads
+    def __init__(self, address: str, timeout: float = 120, connect_timeout: float = 5):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.local = threading.local()
+
+    def connection(self) -> socket.socket:
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            family = socket.AF_INET if isinstance(self.address, tuple) else socket.AF_UNIX
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.address)
+            sock.settimeout(self.timeout)
+            self.local.sock = sock
+            self.local.next_id = 0
+        return sock
+
+    def close(self) -> None:
+        sock = getattr(self.local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+    def request(self, message: dict) -> dict:
+        # Retries once on a fresh connection, e.g. after the server restarted
+        for attempt in range(2):
+            try:
+                sock = self.connection()
+                self.local.next_id += 1
+                sock.sendall(encode_message(message | {"id": self.local.next_id}))
+                response = recv_message(sock)
+                break
+            except (ConnectionError, OSError):
+                self.close()
+                if attempt:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"Embedding server error: {response['error']}")
+        return response
+
+    def embed(self, op: str, texts: list[str]) -> list[dict]:
+        if not texts:
+            return []
+        return [
+            {"bm42": SparseVector(**embedding["bm42"]), "jina": embedding["jina"]}
+            for embedding in self.request({"op": op, "texts": texts})["embeddings"]
+        ]
+
+    def embed_queries(self, texts: list[str]) -> list[tuple[SparseVector, list[float]]]:
+        return [(embedding["bm42"], embedding["jina"]) for embedding in self.embed("query", texts)]
+
+    def embed_passages(self, texts: list[str]) -> list[dict]:
+        return self.embed("passage", texts)
+
+    def stats(self) -> dict:
+        return self.request({"op": "stats"})["stats"]
@@ -0,0 +1,19 @@
+import hashlib
+import json
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def canonical_json(obj) -> str:
+    # Key order and whitespace don't change the meaning of a schema, so they shouldn't change its hash
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def hash_schema(schema: dict) -> str:
+    return hash_text(canonical_json(schema))
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def text_fingerprint(text: str) -> str:
+    # Extracted text differs in whitespace between PDF exports of the same resume, which doesn't change its content
+    return hash_text(" ".join(text.split()))
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from models import Job, CandidateMatch, MatchingConfig
+from utils.auth import supabase
+from utils.match_store import match_repository
+from utils.matching import retrieve_points, is_query_embedding_fresh, build_query_embeddings, make_resume_rater, rate_resumes, score_candidates
+
+# Keeps stored matches up to date as new resumes arrive, without recomputing whole jobs.
+# A new resume is only rated against jobs whose retrieval would now return it, and is then
+# merged into each of those jobs' stored rankings.
+
+QUERY_BATCH_SIZE = 64
+JOB_COLUMNS = "job_id, user_id, job_title, job_desc, rating_schema, rating_schema_weights, matching_config, query_embedding"
+
+def load_jobs() -> list[tuple[Job, dict]]:
+    jobs, stale = [], []
+    for row in supabase.table("jobs").select(JOB_COLUMNS).execute().data:
+        query_embedding = row.pop("query_embedding", None)
+        if isinstance(query_embedding, str):
+            query_embedding = json.loads(query_embedding)
+        job = Job.init_job(**row)
+        if is_query_embedding_fresh(query_embedding, job.rating_schema):
+            jobs.append((job, query_embedding))
+        else:
+            stale.append(job)
+
+    # Missing or outdated query embeddings are computed in one batched pass and stored, as load_matching_job does
+    if stale:
+        for job, query_embedding in zip(stale, build_query_embeddings([job.rating_schema for job in stale])):
+            supabase.table("jobs").update({"query_embedding": query_embedding}).eq("job_id", job.job_id).execute()
+            jobs.append((job, query_embedding))
+    return jobs
+
+async def jobs_retrieving_resume(resume_id: str, jobs: list[tuple[Job, dict]], collection_name: str = "talent-pool") -> list[Job]:
+    # Runs every job's retrieval query in batched Qdrant requests, and keeps the jobs whose
+    # candidate pool now includes the resume
+    matched_jobs = []
+    for start in range(0, len(jobs), QUERY_BATCH_SIZE):
+        batch = jobs[start:start + QUERY_BATCH_SIZE]
+        configs = [job.matching_config or MatchingConfig() for job, _ in batch]
+        retrieved = await retrieve_points([query_embedding for _, query_embedding in batch], configs, collection_name, with_payload=False)
+        for (job, _), points in zip(batch, retrieved):
+            if any(str(point.id) == resume_id for point in points):
+                matched_jobs.append(job)
+    return matched_jobs
+
+def merge_match(job: Job, match: CandidateMatch) -> bool:
+    # Adds the match to the job's stored ranking if it makes the top rating_limit.
+    # Returns whether the stored ranking changed.
+    rating_limit = (job.matching_config or MatchingConfig()).rating_limit
+    stored = match_repository.get_matches(job.job_id)
+    others = [other for other in stored if other.candidate_id != match.candidate_id]
+    kept = sorted(others + [match], reverse=True)[:rating_limit]
+    if not any(kept_match is match for kept_match in kept):
+        return False
+
+    # Join the ranking's current generation (upserting over this candidate's previous row),
+    # and drop anything pushed out of the top rating_limit
+    generation = max((other.generation or 0 for other in stored), default=0) or match_repository.new_generation()
+    match_repository.upsert_matches([match.model_copy(update={"generation": generation})])
+    match_repository.delete_candidates(job.job_id, [other.candidate_id for other in others if other.candidate_id and not any(other is kept_match for kept_match in kept)])
+    return True
+
+async def update_matches_for_resume(resume: dict, collection_name: str = "talent-pool") -> list[str]:
+    # resume is the payload of the newly upserted point plus its "id".
+    # Returns the ids of the jobs whose stored matches changed.
+    resume_id = str(resume["id"])
+    jobs = await jobs_retrieving_resume(resume_id, await asyncio.to_thread(load_jobs), collection_name)
+
+    # Only jobs that already have a ranking are maintained; the others get one on their next full calculation
+    jobs_with_matches = match_repository.job_ids_with_matches([job.job_id for job in jobs])
+
+    jobs = [job for job in jobs if job.job_id in jobs_with_matches]
+
+    # Rate the resume against every affected job concurrently, then merge the results one job at a time
+    async def rate(job: Job) -> CandidateMatch | None:
+        rated = await rate_resumes([resume], make_resume_rater(job.rating_schema, job.matching_config))
+        if not rated:
+            return None
+        score = float(score_candidates([rated[0]["ratings"]], job.rating_schema_weights)[0])
+        return CandidateMatch(**rated[0], score=score, job_id=job.job_id, candidate_id=resume_id)
+
+    matches = await asyncio.gather(*(rate(job) for job in jobs))
+    return [job.job_id for job, match in zip(jobs, matches) if match is not None and merge_match(job, match)]
@@ -0,0 +1,176 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from uuid import uuid4
+
+from utils.env import env
+
+class IngestQueue(ABC):
+    # Queue of resume ingestion jobs. Jobs move from "queued" to "running" to "done" or "failed",
+    # and record how long they spent in each stage.
+
+    @abstractmethod
+    def enqueue(self, user_id: str, name: str, path: str, metadata: dict | None = None) -> str:
+        # metadata holds extra payload fields for the resume, e.g. the owner's city and country
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_id: str) -> None:
+        # Tells the queue the job's worker is still alive
+        ...
+
+    @abstractmethod
+    def record_stage(self, job_id: str, stage: str, seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str, retry: bool = True) -> bool:
+        # Returns whether the job failed for good, i.e. won't be retried
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def pending_count(self) -> int:
+        ...
+
+class SQLiteIngestQueue(IngestQueue):
+    # Local queue shared by the API and worker processes on one host through a SQLite file.
+    # Failed jobs are retried up to max_attempts times, and jobs whose worker died are re-queued once
+    # they have gone stale_after seconds without a heartbeat. started_at holds the job's last heartbeat.
+    def __init__(self, path: str, max_attempts: int = 3, stale_after: float = 600):
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            "job_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, name TEXT NOT NULL, path TEXT NOT NULL, "
+            "status TEXT NOT NULL, stage TEXT, timings TEXT NOT NULL DEFAULT '{}', error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, metadata TEXT NOT NULL DEFAULT '{}')"
+        )
+        # Queue files created before jobs carried metadata
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(ingest_jobs)")}
+        if "metadata" not in columns:
+            self.conn.execute("ALTER TABLE ingest_jobs ADD COLUMN metadata TEXT NOT NULL DEFAULT '{}'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status ON ingest_jobs (status, created_at)")
+
+    def enqueue(self, user_id: str, name: str, path: str, metadata: dict | None = None) -> str:
+        job_id = str(uuid4())
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO ingest_jobs (job_id, user_id, name, path, status, created_at, metadata) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, user_id, name, path, time.time(), json.dumps(metadata or {}))
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> dict | None:
+        now = time.time()
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can't claim the same job
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Stale jobs count against max_attempts like any other failure; the uploads of those that
+                # are out of attempts are deleted once the transaction commits
+                stale_after = now - self.stale_after
+                abandoned = self.conn.execute(
+                    "SELECT path FROM ingest_jobs WHERE status = 'running' AND started_at < ? AND attempts >= ?",
+                    (stale_after, self.max_attempts)
+                ).fetchall()
+                self.conn.execute(
+                    "UPDATE ingest_jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                    "error = COALESCE(error, 'Worker stopped responding'), finished_at = ? WHERE status = 'running' AND started_at < ?",
+                    (self.max_attempts, now, stale_after)
+                )
+                row = self.conn.execute(
+                    "SELECT job_id FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    self._delete_uploads(abandoned)
+                    return None
+                self.conn.execute(
+                    "UPDATE ingest_jobs SET status = 'running', stage = NULL, worker = ?, started_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                    (worker_id, now, row["job_id"])
+                )
+                job = self.conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        self._delete_uploads(abandoned)
+        job = self._to_dict(job)
+        self.record_stage(job["job_id"], "queue_wait", job["started_at"] - job["created_at"])
+        return self.get(job["job_id"])
+
+    def heartbeat(self, job_id: str) -> None:
+        with self.lock:
+            self.conn.execute("UPDATE ingest_jobs SET started_at = ? WHERE job_id = ? AND status = 'running'", (time.time(), job_id))
+
+    def record_stage(self, job_id: str, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE ingest_jobs SET stage = ?, timings = json_set(timings, '$.' || ?, ?) WHERE job_id = ?",
+                (stage, stage, seconds, job_id)
+            )
+
+    def complete(self, job_id: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE ingest_jobs SET status = 'done', error = NULL, finished_at = ? WHERE job_id = ?",
+                (time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, retry: bool = True) -> bool:
+        # Jobs with attempts left go back to the queue, unless retry is False (the error would just happen again);
+        # the error is kept for the status endpoint
+        with self.lock:
+            row = self.conn.execute(
+                "UPDATE ingest_jobs SET status = CASE WHEN ? AND attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "error = ?, finished_at = ? WHERE job_id = ? RETURNING status",
+                (retry, self.max_attempts, error, time.time(), job_id)
+            ).fetchone()
+        return row is None or row["status"] == "failed"
+
+    def get(self, job_id: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def pending_count(self) -> int:
+        with self.lock:
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM ingest_jobs WHERE status IN ('queued', 'running')").fetchone()
+        return count
+
+    @staticmethod
+    def _delete_uploads(rows: list[sqlite3.Row]) -> None:
+        for row in rows:
+            Path(row["path"]).unlink(missing_ok=True)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["timings"] = json.loads(job["timings"])
+        job["metadata"] = json.loads(job["metadata"])
+        return job
+
+UPLOAD_DIR = env.get("UPLOAD_DIR") or "uploads"
+MAX_QUEUED_UPLOADS = int(env.get("MAX_QUEUED_UPLOADS") or 1000)
+
+ingest_queue = SQLiteIngestQueue(env.get("INGEST_QUEUE_PATH") or "ingest_queue.db")
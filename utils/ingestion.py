@@ -0,0 +1,121 @@
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+from uuid import NAMESPACE_URL, uuid5
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+from utils.chunking import build_chunk_points, replace_chunks
+from utils.embedding import embed_passages
+from utils.hashing import hash_text
+from utils.pdf import extract_files, extract_text
+from utils.resume_fields import resume_payload
+
+RESUME_SUFFIXES = {".json", ".jsonl", ".pdf"}
+
+def resume_point_id(resume: dict, source: str) -> str:
+    # Qdrant ids must be UUIDs, so resumes without one get a stable id derived from their content
+    if resume.get("id"):
+        return str(resume["id"])
+    return str(uuid5(NAMESPACE_URL, f"{source}:{hash_text(resume['resume'])}"))
+
+def with_structured_fields(resume: dict) -> dict:
+    # Adds the filterable payload fields (skills, years of experience, normalized location, upload time)
+    # while keeping any other fields the source file provides
+    fields = resume_payload(resume["resume"], resume.get("name") or "", resume.get("city"), resume.get("country"), resume.get("uploaded_at"))
+    return resume | fields
+
+def iter_resume_files(paths: Iterable[str]) -> Iterator[Path]:
+    # Sorted, so the stream order (and therefore the checkpoint) is stable between runs
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.suffix.lower() in RESUME_SUFFIXES)
+        else:
+            yield path
+
+def load_resume_file(path: Path) -> Iterator[dict]:
+    # JSON files hold a list of resume objects, JSONL files one object per line, and PDFs one resume each
+    suffix = path.suffix.lower()
+    if suffix == ".pdf":
+        yield {"resume": extract_text(path.read_bytes()), "name": path.stem}
+    elif suffix == ".jsonl":
+        with open(path, "r") as f:
+            yield from (json.loads(line) for line in f if line.strip())
+    else:
+        with open(path, "r") as f:
+            yield from json.load(f)
+
+def iter_resumes(paths: Iterable[str]) -> Iterator[dict]:
+    # Streams resumes as payload dicts with at least "id" and "resume".
+    # PDFs are extracted ahead of the stream when there is an extraction pool (see utils/pdf.py).
+    for path, text in extract_files(iter_resume_files(paths)):
+        resumes = [{"resume": text, "name": path.stem}] if text is not None else load_resume_file(path)
+        for resume in resumes:
+            yield resume | {"id": resume_point_id(resume, str(path))}
+
+class Checkpoint:
+    # Append-only file of ingested point ids, so an interrupted ingestion can resume where it stopped
+    def __init__(self, path: str | None):
+        self.path = path
+        self.ids = set()
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self.ids = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, point_id: str) -> bool:
+        return point_id in self.ids
+
+    def add(self, point_ids: list[str]) -> None:
+        self.ids.update(point_ids)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write("".join(f"{point_id}\n" for point_id in point_ids))
+
+def batched(iterable: Iterable, n: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, n)):
+        yield batch
+
+def ingest_resumes(
+    resumes: Iterable[dict],
+    vector_client: QdrantClient,
+    collection_name: str = "talent-pool",
+    upsert_batch_size: int = 256,
+    embed_batch_size: int = 32,
+    parallel: int | None = None,
+    checkpoint_path: str | None = None,
+    chunk_collection_name: str | None = None,
+) -> dict:
+    # With chunk_collection_name set, each batch's section chunks are embedded and stored there too
+    checkpoint = Checkpoint(checkpoint_path)
+    previously_ingested = len(checkpoint.ids)
+    pending = (with_structured_fields(resume) for resume in resumes if resume["id"] not in checkpoint)
+
+    # One stream feeds the embedder and another carries the payloads, zipped back together in order
+    payloads, texts = itertools.tee(pending)
+    vectors = embed_passages((resume["resume"] for resume in texts), batch_size=embed_batch_size, parallel=parallel)
+
+    start = time.perf_counter()
+    n_docs = 0
+    for batch in batched(zip(payloads, vectors), upsert_batch_size):
+        points = [PointStruct(id=payload["id"], vector=vector, payload=payload) for payload, vector in batch]
+        vector_client.upsert(collection_name=collection_name, points=points)
+        if chunk_collection_name:
+            chunk_points = build_chunk_points([payload for payload, _ in batch], batch_size=embed_batch_size, parallel=parallel)
+            replace_chunks(vector_client, chunk_points, chunk_collection_name)
+        checkpoint.add([point.id for point in points])
+
+        n_docs += len(points)
+        elapsed = time.perf_counter() - start
+        print(f"Ingested {n_docs} resumes in {elapsed:.1f}s ({n_docs / elapsed:.1f} docs/sec)")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "docs": n_docs,
+        "previously_ingested": previously_ingested,
+        "seconds": elapsed,
+        "docs_per_sec": n_docs / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,21 @@
+import threading
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+class Lazy(Generic[T]):
+    # Decorator for a zero-argument factory: the value is created on the first call rather than at import,
+    # exactly once even when several threads ask for it at the same time, and then reused
+    def __init__(self, factory: Callable[[], T]):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.value: T | None = None
+        self.loaded = False
+
+    def __call__(self) -> T:
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.value = self.factory()
+                    self.loaded = True
+        return self.value
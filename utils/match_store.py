@@ -0,0 +1,197 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from supabase import Client
+
+from models import CandidateMatch
+from utils.env import env
+
+class MatchRepository(ABC):
+    # Stored candidate rankings. Rows are keyed on (job_id, candidate_id) and stamped with the generation
+    # of the refresh that wrote them. A refresh upserts its rows first and then deletes only the rows older
+    # refreshes left behind, so readers never see an empty or duplicated ranking, and a slower, older
+    # refresh can never delete the rows of a newer one.
+
+    @staticmethod
+    def new_generation() -> int:
+        return time.time_ns()
+
+    @abstractmethod
+    def get_matches(self, job_id: str) -> list[CandidateMatch]:
+        ...
+
+    @abstractmethod
+    def job_ids_with_matches(self, job_ids: list[str]) -> set[str]:
+        ...
+
+    @abstractmethod
+    def upsert_matches(self, matches: list[CandidateMatch]) -> None:
+        # Every match must have a candidate_id and a generation
+        ...
+
+    @abstractmethod
+    def delete_stale(self, job_ids: list[str], generation: int, keep: dict[str, set[str]] | None = None) -> None:
+        # Deletes the rows of these jobs written by refreshes older than generation, except those of the
+        # candidates in keep[job_id]: candidates the refresh retrieved but couldn't rate, whose previous
+        # ratings are better than none
+        ...
+
+    @abstractmethod
+    def delete_candidates(self, job_id: str, candidate_ids: list[str]) -> None:
+        ...
+
+    @abstractmethod
+    def delete_outdated_resume(self, candidate_id: str, resume_version: int) -> None:
+        # Deletes the candidate's rows, across all jobs, rated from an older version of their resume
+        ...
+
+    def replace_matches(self, job_ids: list[str], matches: list[CandidateMatch], keep: dict[str, set[str]] | None = None) -> int:
+        # Replaces the rankings of job_ids with matches in two round trips. Returns the new generation.
+        generation = self.new_generation()
+        self.upsert_matches([match.model_copy(update={"generation": generation}) for match in matches])
+        self.delete_stale(job_ids, generation, keep)
+        return generation
+
+class SupabaseMatchRepository(MatchRepository):
+    # Needs the columns, constraint and replace_matches function in supabase/migrations
+    def __init__(self, client: Client, table: str = "matches"):
+        self.client = client
+        self.table = table
+
+    def get_matches(self, job_id: str) -> list[CandidateMatch]:
+        rows = self.client.table(self.table).select("*").eq("job_id", job_id).order("score", desc=True).execute().data
+        return [CandidateMatch(**row) for row in rows]
+
+    def job_ids_with_matches(self, job_ids: list[str]) -> set[str]:
+        if not job_ids:
+            return set()
+        rows = self.client.table(self.table).select("job_id").in_("job_id", job_ids).execute().data
+        return {row["job_id"] for row in rows}
+
+    def upsert_matches(self, matches: list[CandidateMatch]) -> None:
+        if matches:
+            self.client.table(self.table).upsert([match.model_dump() for match in matches], on_conflict="job_id,candidate_id").execute()
+
+    def delete_stale(self, job_ids: list[str], generation: int, keep: dict[str, set[str]] | None = None) -> None:
+        keep = {job_id: candidate_ids for job_id, candidate_ids in (keep or {}).items() if candidate_ids and job_id in job_ids}
+        # Rows from before generations existed have a null generation and are stale as well
+        stale = f"generation.lt.{generation},generation.is.null"
+        other_jobs = [job_id for job_id in job_ids if job_id not in keep]
+        if other_jobs:
+            self.client.table(self.table).delete().in_("job_id", other_jobs).or_(stale).execute()
+        for job_id, candidate_ids in keep.items():
+            self.client.table(self.table).delete().eq("job_id", job_id).or_(stale).not_.in_("candidate_id", sorted(candidate_ids)).execute()
+
+    def delete_candidates(self, job_id: str, candidate_ids: list[str]) -> None:
+        if candidate_ids:
+            self.client.table(self.table).delete().eq("job_id", job_id).in_("candidate_id", candidate_ids).execute()
+
+    def delete_outdated_resume(self, candidate_id: str, resume_version: int) -> None:
+        # Rows from before resume versions existed have a null resume_version and are outdated as well
+        self.client.table(self.table).delete().eq("candidate_id", candidate_id).or_(f"resume_version.lt.{resume_version},resume_version.is.null").execute()
+
+    def replace_matches(self, job_ids: list[str], matches: list[CandidateMatch], keep: dict[str, set[str]] | None = None) -> int:
+        # One round trip and one transaction, in the replace_matches Postgres function, which always writes the matches table
+        generation = self.new_generation()
+        self.client.rpc("replace_matches", {
+            "p_job_ids": job_ids,
+            "p_matches": [match.model_dump() for match in matches],
+            "p_generation": generation,
+            "p_keep": {job_id: sorted(candidate_ids) for job_id, candidate_ids in (keep or {}).items() if candidate_ids},
+        }).execute()
+        return generation
+
+class SQLiteMatchRepository(MatchRepository):
+    # Local backend for tests and development without Supabase. A refresh runs in a single transaction.
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            "job_id TEXT NOT NULL, candidate_id TEXT NOT NULL, resume TEXT NOT NULL, score REAL NOT NULL, "
+            "name TEXT NOT NULL, ratings TEXT NOT NULL, generation INTEGER NOT NULL, resume_version INTEGER, "
+            "PRIMARY KEY (job_id, candidate_id))"
+        )
+        # Match stores created before rows carried a resume version
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(matches)")}
+        if "resume_version" not in columns:
+            self.conn.execute("ALTER TABLE matches ADD COLUMN resume_version INTEGER")
+
+    def get_matches(self, job_id: str) -> list[CandidateMatch]:
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM matches WHERE job_id = ? ORDER BY score DESC", (job_id,)).fetchall()
+        return [CandidateMatch(**dict(row) | {"ratings": json.loads(row["ratings"])}) for row in rows]
+
+    def job_ids_with_matches(self, job_ids: list[str]) -> set[str]:
+        if not job_ids:
+            return set()
+        placeholders = ",".join("?" * len(job_ids))
+        with self.lock:
+            rows = self.conn.execute(f"SELECT DISTINCT job_id FROM matches WHERE job_id IN ({placeholders})", job_ids).fetchall()
+        return {row["job_id"] for row in rows}
+
+    def upsert_matches(self, matches: list[CandidateMatch]) -> None:
+        with self.lock:
+            self._upsert(matches)
+
+    def delete_stale(self, job_ids: list[str], generation: int, keep: dict[str, set[str]] | None = None) -> None:
+        with self.lock:
+            self._delete_stale(job_ids, generation, keep)
+
+    def delete_candidates(self, job_id: str, candidate_ids: list[str]) -> None:
+        if not candidate_ids:
+            return
+        placeholders = ",".join("?" * len(candidate_ids))
+        with self.lock:
+            self.conn.execute(f"DELETE FROM matches WHERE job_id = ? AND candidate_id IN ({placeholders})", [job_id, *candidate_ids])
+
+    def delete_outdated_resume(self, candidate_id: str, resume_version: int) -> None:
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM matches WHERE candidate_id = ? AND (resume_version IS NULL OR resume_version < ?)",
+                (candidate_id, resume_version)
+            )
+
+    def replace_matches(self, job_ids: list[str], matches: list[CandidateMatch], keep: dict[str, set[str]] | None = None) -> int:
+        generation = self.new_generation()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._upsert([match.model_copy(update={"generation": generation}) for match in matches])
+                self._delete_stale(job_ids, generation, keep)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return generation
+
+    def _upsert(self, matches: list[CandidateMatch]) -> None:
+        self.conn.executemany(
+            "INSERT INTO matches (job_id, candidate_id, resume, score, name, ratings, generation, resume_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (job_id, candidate_id) DO UPDATE SET resume = excluded.resume, score = excluded.score, "
+            "name = excluded.name, ratings = excluded.ratings, generation = excluded.generation, resume_version = excluded.resume_version",
+            [(m.job_id, m.candidate_id, m.resume, m.score, m.name, json.dumps(m.ratings), m.generation, m.resume_version) for m in matches]
+        )
+
+    def _delete_stale(self, job_ids: list[str], generation: int, keep: dict[str, set[str]] | None = None) -> None:
+        for job_id in job_ids:
+            kept = sorted((keep or {}).get(job_id, ()))
+            placeholders = ",".join("?" * len(kept))
+            self.conn.execute(
+                f"DELETE FROM matches WHERE job_id = ? AND generation < ? AND candidate_id NOT IN ({placeholders})",
+                [job_id, generation, *kept]
+            )
+
+def make_match_repository() -> MatchRepository:
+    # MATCH_STORE_PATH switches match persistence to a local SQLite file
+    if env.get("MATCH_STORE_PATH"):
+        return SQLiteMatchRepository(env["MATCH_STORE_PATH"])
+    from utils.auth import supabase
+    return SupabaseMatchRepository(supabase)
+
+match_repository = make_match_repository()
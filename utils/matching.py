@@ -1,71 +1,345 @@
-from qdrant_client import QdrantClient, models
-import threading
-import json
+from qdrant_client import models
+import asyncio
+import time
+from typing import AsyncIterator
+import numpy as np
 
-from utils.env import env
-from utils.agents import ResumeRater
-from utils.embedding import bm42_embed, jina_embed
+from utils.agents import ResumeRater, BatchResumeRater, model_config
+from utils.chunking import CHUNK_COLLECTION
+from utils.embedding import embed_queries, rerank_scores
+from utils.hashing import hash_text, hash_schema
+from utils.metrics import queue_wait_seconds
+from utils.rating_cache import RatingCache, rating_cache
+from utils.timing import timed
+from utils.tracing import span
+from utils.vector_db import get_async_vector_client
+from models import Job, MatchingConfig, CandidateFilters
 
-client = QdrantClient(url=env["QDRANT_URL"], api_key=env["QDRANT_API_KEY"])
-N_THREADS = 2
+MAX_CONCURRENCY = model_config["resume_rater"].get("max_concurrency", 10)
 
-def calculate_resume_matches(rating_schema: dict, schema_weights: dict[str, float], collection_name: str = "talent-pool") -> list[dict]:
+def embed_query(text: str) -> tuple[models.SparseVector, list[float]]:
+    # Both embeddings from one call, so the embedding server runs each model once
+    return embed_queries([text])[0]
 
-    schema_keys = list(rating_schema["properties"].keys())
+def schema_query_text(rating_schema: dict) -> str:
+    return str(list(rating_schema["properties"].keys()))
 
-    # Compute two embeddings for the rating categories:
+def build_query_embeddings(rating_schemas: list[dict]) -> list[dict]:
+    # Compute two embeddings for the rating categories of each schema, in one batched pass:
     # BM42: good balance of keyword matching and semantic meaning
     # Jina: good at semantic meaning, but not as good at keyword matching
-    sparse_embedding = bm42_embed(str(schema_keys))
-    dense_embedding = jina_embed(str(schema_keys))
+    # Each result is stored with its job, along with a hash of the text it was computed from
+    query_texts = [schema_query_text(rating_schema) for rating_schema in rating_schemas]
+    return [
+        {
+            "schema_hash": hash_text(query_text),
+            "bm42": {"indices": sparse_embedding.indices, "values": sparse_embedding.values},
+            "jina": dense_embedding,
+        }
+        for query_text, (sparse_embedding, dense_embedding) in zip(query_texts, embed_queries(query_texts))
+    ]
 
-    # Query from talent pool
-    # Taken from https://qdrant.tech/articles/bm42/
-    results = client.query_points(
-        collection_name=collection_name,
+def build_query_embedding(rating_schema: dict) -> dict:
+    return build_query_embeddings([rating_schema])[0]
+
+def is_query_embedding_fresh(query_embedding: dict | None, rating_schema: dict) -> bool:
+    # Stored embeddings go stale when the rating categories change
+    return bool(query_embedding) and query_embedding.get("schema_hash") == hash_text(schema_query_text(rating_schema))
+
+def make_resume_rater(rating_schema: dict, config: MatchingConfig | None = None) -> ResumeRater:
+    if config and config.rating_batch_size > 1:
+        return BatchResumeRater(rating_schema, config.rating_batch_size)
+    return ResumeRater(rating_schema)
+
+def sparse_dot(vector: models.SparseVector, query: dict[int, float]) -> float:
+    return sum(query.get(index, 0.0) * value for index, value in zip(vector.indices, vector.values))
+
+def min_max_normalize(scores: np.ndarray) -> np.ndarray:
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread else np.zeros_like(scores)
+
+def weighted_fusion_scores(points: list, sparse_embedding: models.SparseVector, dense_embedding: list[float], dense_weight: float) -> np.ndarray:
+    # Cheap local re-ranking: a weighted sum of min-max normalized Jina cosine similarity and BM42 dot product.
+    # The BM42 term leaves out the IDF weighting Qdrant applies, which is fine for ordering a shortlist.
+    dense_query = np.array(dense_embedding)
+    dense_vectors = np.array([point.vector["jina"] for point in points])
+    dense_scores = dense_vectors @ dense_query / (np.linalg.norm(dense_vectors, axis=1) * np.linalg.norm(dense_query))
+
+    sparse_query = dict(zip(sparse_embedding.indices, sparse_embedding.values))
+    sparse_scores = np.array([sparse_dot(point.vector["bm42"], sparse_query) for point in points])
+
+    return dense_weight * min_max_normalize(dense_scores) + (1 - dense_weight) * min_max_normalize(sparse_scores)
+
+def candidate_filter(filters: CandidateFilters | None) -> models.Filter | None:
+    # Translates a job's filters into a Qdrant filter over the payload fields from utils/resume_fields.py.
+    # Qdrant applies it during the vector search, using the payload indexes, so every prefetched
+    # candidate already qualifies instead of being dropped after retrieval.
+    if filters is None:
+        return None
+    conditions = []
+    if filters.cities:
+        conditions.append(models.FieldCondition(key="city", match=models.MatchAny(any=[city.strip().lower() for city in filters.cities])))
+    if filters.countries:
+        conditions.append(models.FieldCondition(key="country", match=models.MatchAny(any=[country.strip().lower() for country in filters.countries])))
+    for skill in filters.skills or []:
+        conditions.append(models.FieldCondition(key="skills", match=models.MatchValue(value=skill.strip().lower())))
+    if filters.min_years_experience is not None:
+        conditions.append(models.FieldCondition(key="years_experience", range=models.Range(gte=filters.min_years_experience)))
+    if filters.uploaded_within_days is not None:
+        conditions.append(models.FieldCondition(key="uploaded_at", range=models.Range(gte=time.time() - filters.uploaded_within_days * 86400)))
+    return models.Filter(must=conditions) if conditions else None
+
+def dense_search_params(config: MatchingConfig) -> models.SearchParams | None:
+    # Quantization settings are ignored by collections without quantization
+    if config.hnsw_ef is None and config.quantization_oversampling is None and config.quantization_rescore:
+        return None
+    return models.SearchParams(
+        hnsw_ef=config.hnsw_ef,
+        quantization=models.QuantizationSearchParams(rescore=config.quantization_rescore, oversampling=config.quantization_oversampling),
+    )
+
+def retrieval_request(query_embedding: dict, config: MatchingConfig) -> models.QueryRequest:
+    # Hybrid query over both indexes, taken from https://qdrant.tech/articles/bm42/
+    # The job's filters apply to both prefetches, so each returns prefetch_limit qualifying candidates
+    query_filter = candidate_filter(config.filters)
+    return models.QueryRequest(
         prefetch=[
-            models.Prefetch(query=sparse_embedding, using="bm42", limit=10),
-            models.Prefetch(query=dense_embedding,  using="jina", limit=10),
+            models.Prefetch(query=models.SparseVector(**query_embedding["bm42"]), using="bm42", filter=query_filter, limit=config.prefetch_limit),
+            models.Prefetch(query=query_embedding["jina"],  using="jina", filter=query_filter, params=dense_search_params(config), limit=config.prefetch_limit),
         ],
         # Use reciprocal rank fusion to combine the similarity scores of the BM42 and Jina embeddings
         query=models.FusionQuery(fusion=models.Fusion.RRF),
-        limit=10
+        limit=config.rerank_limit,
+        with_payload=True,
+        # The weighted re-ranker scores candidates locally from their stored vectors
+        with_vector=["bm42", "jina"] if config.reranker == "weighted" else False,
     )
 
-    # Extract the payload and id from the results
-    resume_list = [result.payload | {"id": result.id} for result in results.points]
-    ratings_list = []
+# Resumes have several chunks, so chunk prefetches go this much deeper to reach prefetch_limit candidates
+CHUNK_PREFETCH_FACTOR = 4
+
+def chunk_groups_request(query_embedding: dict, config: MatchingConfig, collection_name: str, with_payload: bool = True) -> dict:
+    # query_points_groups arguments for a hybrid search over resume chunks. Chunks are grouped by candidate,
+    # keeping only each candidate's best chunk, so candidates are ranked by their best-matching section (max-sim).
+    # Each group is resolved to its whole-resume point in collection_name, which later stages rate and re-rank.
+    request = retrieval_request(query_embedding, config)
+    for prefetch in request.prefetch:
+        prefetch.limit = config.prefetch_limit * CHUNK_PREFETCH_FACTOR
+    return {
+        "collection_name": CHUNK_COLLECTION,
+        "prefetch": request.prefetch,
+        "query": request.query,
+        "group_by": "candidate_id",
+        "group_size": 1,
+        "limit": config.rerank_limit,
+        "with_payload": False,
+        "with_lookup": models.WithLookup(
+            collection=collection_name,
+            with_payload=with_payload,
+            with_vectors=request.with_vector if with_payload else False,
+        ),
+    }
+
+async def retrieve_points(query_embeddings: list[dict], configs: list[MatchingConfig], collection_name: str = "talent-pool", with_payload: bool = True) -> list[list]:
+    # Stage 1 for several jobs at once: whole-resume retrievals share one query_batch_points request,
+    # and chunk retrievals run as concurrent grouped queries. Returns each job's resume points in rank order.
+    client = get_async_vector_client()
+    results: list[list] = [[] for _ in configs]
+    resume_jobs = [i for i, config in enumerate(configs) if config.retrieval_unit == "resume"]
+    chunk_jobs = [i for i, config in enumerate(configs) if config.retrieval_unit == "chunk"]
+
+    async def retrieve_resume_jobs() -> None:
+        requests = [retrieval_request(query_embeddings[i], configs[i]) for i in resume_jobs]
+        if not with_payload:
+            for request in requests:
+                request.with_payload = False
+                request.with_vector = False
+        responses = await client.query_batch_points(collection_name=collection_name, requests=requests) if requests else []
+        for i, response in zip(resume_jobs, responses):
+            results[i] = response.points
+
+    async def retrieve_chunk_job(i: int) -> None:
+        response = await client.query_points_groups(**chunk_groups_request(query_embeddings[i], configs[i], collection_name, with_payload))
+        # Groups whose resume point no longer exists have no lookup
+        results[i] = [group.lookup for group in response.groups if group.lookup is not None]
+
+    await asyncio.gather(retrieve_resume_jobs(), *(retrieve_chunk_job(i) for i in chunk_jobs))
+    return results
+
+async def rerank_points(points: list, query_embedding: dict, config: MatchingConfig, rerank_query: str) -> list:
+    scores = None
+    if points and config.reranker == "weighted":
+        scores = weighted_fusion_scores(points, models.SparseVector(**query_embedding["bm42"]), query_embedding["jina"], config.dense_weight)
+    elif points and config.reranker == "cross_encoder":
+        documents = [point.payload["resume"] for point in points]
+        scores = np.array(await asyncio.to_thread(rerank_scores, rerank_query, documents))
+    if scores is None:
+        return points
+    return [points[i] for i in np.argsort(-scores, kind="stable")]
+
+async def retrieve_resumes(rating_schema: dict, collection_name: str = "talent-pool", query_embedding: dict | None = None, config: MatchingConfig | None = None, rerank_query: str | None = None, timings: dict[str, float] | None = None) -> list[dict]:
+    config = config or MatchingConfig()
+    timings = {} if timings is None else timings
+
+    # Reuse the job's stored query embeddings when they are up to date. Otherwise compute them
+    # in a worker thread, since embedding is CPU-bound and would block the event loop.
+    with timed(timings, "embed"):
+        if not is_query_embedding_fresh(query_embedding, rating_schema):
+            query_embedding = await asyncio.to_thread(build_query_embedding, rating_schema)
+
+    # Stage 1: wide retrieval from the talent pool
+    with timed(timings, "retrieve", unit=config.retrieval_unit):
+        (points,) = await retrieve_points([query_embedding], [config], collection_name)
+
+    # Stage 2: cheap local re-ranking, so only the best candidates go to the LLM
+    with timed(timings, "rerank"):
+        points = await rerank_points(points, query_embedding, config, rerank_query or schema_query_text(rating_schema))
+
+    # Extract the payload and id from the candidates that will be rated
+    return [point.payload | {"id": point.id} for point in points[:config.rating_limit]]
+
+async def calculate_resume_matches(rating_schema: dict, schema_weights: dict[str, float], collection_name: str = "talent-pool", query_embedding: dict | None = None, config: MatchingConfig | None = None, rerank_query: str | None = None, timings: dict[str, float] | None = None, cache: RatingCache | None = rating_cache, failed: set[str] | None = None) -> list[dict]:
+    # Candidates whose rating failed are left out of the results, and their ids are added to failed
+    timings = {} if timings is None else timings
+
+    resume_list = await retrieve_resumes(rating_schema, collection_name, query_embedding, config, rerank_query, timings)
 
     # Initialize the LLM resume rater - rates resumes based on the rating schema
-    resume_rater = ResumeRater(rating_schema)
-
-    # Process the resumes in parallel
-    chunk_size = len(resume_list) // N_THREADS
-
-    # Create and start threads
-    threads = []
-    for i in range(N_THREADS):
-        start_index = i * chunk_size
-        end_index = start_index + chunk_size if i < N_THREADS - 1 else None
-        chunk = resume_list[start_index:end_index]
-        
-        thread = threading.Thread(target=process_chunk, args=(chunk,resume_rater,ratings_list))
-        thread.start()
-        threads.append(thread)
-    
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
+    resume_rater = make_resume_rater(rating_schema, config)
+
+    # Stage 3: rate the remaining resumes concurrently
+    with timed(timings, "rate"):
+        ratings_list = await rate_resumes(resume_list, resume_rater, cache=cache, failed=failed)
 
     # Calculate the score for each candidate by multiplying the ratings by the weights
     # provided by the prospective employer, and summing the results
-    for candidate in ratings_list:
-        candidate["score"] = sum([candidate["ratings"][key] * schema_weights[key] for key in candidate["ratings"].keys()])
+    scores = score_candidates([candidate["ratings"] for candidate in ratings_list], schema_weights)
+    for candidate, score in zip(ratings_list, scores):
+        candidate["score"] = float(score)
 
     return ratings_list
 
-def process_chunk(chunk, resume_rater: ResumeRater, ratings_list: list) -> None:
-    for resume_dict in chunk:
-        ratings = resume_rater.respond(resume_dict["resume"])
-        resume_dict["ratings"] = json.loads(ratings)
-        ratings_list.append(resume_dict)
\ No newline at end of file
+async def calculate_batch_matches(jobs: list[tuple[Job, dict | None]], collection_name: str = "talent-pool", max_concurrency: int = MAX_CONCURRENCY, timings: dict[str, float] | None = None, failed: dict[str, set[str]] | None = None) -> dict[str, list[dict]]:
+    # Matches for many jobs at once, sharing work between them:
+    # - missing or stale query embeddings are computed in one batched pass
+    # - every job's whole-resume retrieval runs in a single Qdrant query_batch_points request
+    # - jobs with identical rating schemas share one rating run over the union of their candidates
+    # - all rating calls draw from one concurrency budget
+    # jobs holds (job, stored query embedding) pairs; the result maps job ids to scored candidates.
+    # failed, when given, maps the job ids with failed ratings to those candidates' ids.
+    timings = {} if timings is None else timings
+    configs = [job.matching_config or MatchingConfig() for job, _ in jobs]
+
+    with timed(timings, "embed"):
+        stale = [i for i, (job, query_embedding) in enumerate(jobs) if not is_query_embedding_fresh(query_embedding, job.rating_schema)]
+        fresh_embeddings = await asyncio.to_thread(build_query_embeddings, [jobs[i][0].rating_schema for i in stale]) if stale else []
+        query_embeddings = [query_embedding for _, query_embedding in jobs]
+        for i, query_embedding in zip(stale, fresh_embeddings):
+            query_embeddings[i] = query_embedding
+
+    with timed(timings, "retrieve"):
+        retrieved = await retrieve_points(query_embeddings, configs, collection_name)
+
+    with timed(timings, "rerank"):
+        reranked = await asyncio.gather(*(
+            rerank_points(points, query_embedding, config, job.job_desc)
+            for (job, _), points, query_embedding, config in zip(jobs, retrieved, query_embeddings, configs)
+        ))
+        candidates = [[point.payload | {"id": point.id} for point in points[:config.rating_limit]] for points, config in zip(reranked, configs)]
+
+    # Group jobs that would send identical rating requests, and rate each group's candidates once
+    groups: dict[tuple[str, int], list[int]] = {}
+    for i, ((job, _), config) in enumerate(zip(jobs, configs)):
+        groups.setdefault((hash_schema(job.rating_schema), config.rating_batch_size), []).append(i)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def rate_group(indices: list[int]) -> dict[str, dict]:
+        union = {str(resume["id"]): resume for i in indices for resume in candidates[i]}
+        job, config = jobs[indices[0]][0], configs[indices[0]]
+        group_failed = set()
+        rated = await rate_resumes(list(union.values()), make_resume_rater(job.rating_schema, config), semaphore=semaphore, failed=group_failed)
+        if failed is not None:
+            for i in indices:
+                job_failed = group_failed & {str(resume["id"]) for resume in candidates[i]}
+                if job_failed:
+                    failed[jobs[i][0].job_id] = job_failed
+        return {str(resume["id"]): resume["ratings"] for resume in rated}
+
+    with timed(timings, "rate"):
+        group_ratings = await asyncio.gather(*(rate_group(indices) for indices in groups.values()))
+
+    matches = {}
+    for indices, ratings in zip(groups.values(), group_ratings):
+        for i in indices:
+            job = jobs[i][0]
+            rated = [resume | {"ratings": ratings[str(resume["id"])]} for resume in candidates[i] if str(resume["id"]) in ratings]
+            scores = score_candidates([resume["ratings"] for resume in rated], job.rating_schema_weights)
+            matches[job.job_id] = [resume | {"score": float(score)} for resume, score in zip(rated, scores)]
+    return matches
+
+def score_candidates(ratings_list: list[dict[str, float]], schema_weights: dict[str, float]) -> np.ndarray:
+    # Scores for all candidates as one matrix-vector product: (candidates x categories) @ (categories)
+    keys = list(schema_weights.keys())
+    ratings = np.array([[ratings.get(key, 0) for key in keys] for ratings in ratings_list], dtype=float).reshape(-1, len(keys))
+    weights = np.array([schema_weights[key] for key in keys], dtype=float)
+    return ratings @ weights
+
+async def iter_rated_resumes(resume_list: list[dict], resume_rater: ResumeRater, max_concurrency: int = MAX_CONCURRENCY, cache: RatingCache | None = rating_cache, semaphore: asyncio.Semaphore | None = None, failed: set[str] | None = None) -> AsyncIterator[tuple[int, dict]]:
+    # Yields (index in resume_list, resume with "ratings") as each rating becomes available.
+    # The ids of candidates whose rating failed are added to failed, so callers can tell them apart from
+    # candidates that were never retrieved.
+    # Resumes are rated in groups of resume_rater.batch_size, with at most max_concurrency calls in flight
+    # (or as many as a semaphore shared with other rating runs allows).
+    semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+    keys = [resume_rater.cache_key(resume_dict["resume"]) for resume_dict in resume_list]
+
+    # Resumes already rated against this exact schema, model and prompt skip the LLM entirely
+    with span("rating_cache_lookup", resumes=len(keys)) as attributes:
+        cached = cache.get_many(keys) if cache else {}
+        attributes["hits"] = len(cached)
+    for index, key in enumerate(keys):
+        if key in cached:
+            yield index, resume_list[index] | {"ratings": cached[key]}
+
+    pending = [index for index, key in enumerate(keys) if key not in cached]
+    batches = [pending[i:i + resume_rater.batch_size] for i in range(0, len(pending), resume_rater.batch_size)]
+
+    async def rate(batch: list[int]) -> list[tuple[int, dict]]:
+        candidate_ids = {str(resume_list[index]["id"]): index for index in batch}
+        queued_at = time.perf_counter()
+        async with semaphore:
+            queue_wait_seconds.observe(time.perf_counter() - queued_at, queue="rating")
+            try:
+                ratings = await resume_rater.respond_batch({candidate_id: resume_list[index]["resume"] for candidate_id, index in candidate_ids.items()})
+            except Exception as e:
+                # Candidates whose rating failed after all retries are left out of the results
+                print(f"Error rating resumes {list(candidate_ids)}: {e}")
+                if failed is not None:
+                    failed.update(candidate_ids)
+                return []
+        missing = candidate_ids.keys() - ratings.keys()
+        if missing:
+            print(f"No rating returned for resumes {sorted(missing)}")
+            if failed is not None:
+                failed.update(missing)
+        return [(index, ratings[candidate_id]) for candidate_id, index in candidate_ids.items() if candidate_id in ratings]
+
+    tasks = [asyncio.create_task(rate(batch)) for batch in batches]
+    try:
+        for next_batch in asyncio.as_completed(tasks):
+            for index, ratings in await next_batch:
+                if cache:
+                    cache.set(keys[index], ratings)
+                yield index, resume_list[index] | {"ratings": ratings}
+    finally:
+        # Stop outstanding calls if the consumer goes away early (e.g. a closed stream)
+        for task in tasks:
+            task.cancel()
+
+async def rate_resumes(resume_list: list[dict], resume_rater: ResumeRater, max_concurrency: int = MAX_CONCURRENCY, cache: RatingCache | None = rating_cache, semaphore: asyncio.Semaphore | None = None, failed: set[str] | None = None) -> list[dict]:
+    # Each rating is written to its own slot, so results keep the retrieval order
+    ratings_list = [None] * len(resume_list)
+    async for index, rated_resume in iter_rated_resumes(resume_list, resume_rater, max_concurrency, cache, semaphore, failed):
+        ratings_list[index] = rated_resume
+    return [rated_resume for rated_resume in ratings_list if rated_resume is not None]
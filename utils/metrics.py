@@ -0,0 +1,102 @@
+import math
+import threading
+from typing import Callable
+
+# Minimal in-process metrics in the Prometheus text exposition format, served by /metrics.
+# Values are per process, so run one scrape target per API worker.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in sorted(labels.items())) + "}"
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{format_labels(dict(key))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # labels -> (count per bucket, +Inf count, sum)
+        self.values: dict[tuple, tuple[list[int], int, float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            bucket_counts, count, total = self.values.get(key) or ([0] * len(self.buckets), 0, 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+            self.values[key] = (bucket_counts, count + 1, total + value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (bucket_counts, count, total) in self.values.items():
+                labels = dict(key)
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f"{self.name}_bucket{format_labels(labels | {'le': bound})} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(labels | {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+        self.collectors: list[tuple[str, Callable[[], dict[str, float]]]] = []
+
+    def counter(self, name: str, description: str) -> Counter:
+        metric = Counter(name, description)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_gauges(self, prefix: str, collect: Callable[[], dict[str, float]]) -> None:
+        # Reports every numeric value of collect() (e.g. a cache's stats()) as a gauge named <prefix>_<key>
+        self.collectors.append((prefix, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for prefix, collect in self.collectors:
+            for key, value in collect().items():
+                if isinstance(value, (int, float)) and not math.isnan(value):
+                    lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+stage_seconds = registry.histogram("stage_duration_seconds", "Time spent in each traced stage")
+http_request_seconds = registry.histogram("http_request_duration_seconds", "HTTP request latency")
+queue_wait_seconds = registry.histogram("queue_wait_seconds", "Time spent waiting for a queue or concurrency slot")
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens used")
+llm_retries = registry.counter("llm_retries_total", "LLM calls retried after a retryable error")
@@ -0,0 +1,130 @@
+import importlib.util
+import io
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from utils.env import env
+from utils.lazy import Lazy
+
+# PDF text extraction with pluggable backends, fastest first: PyMuPDF ("pymupdf") and pdfium ("pypdfium2"),
+# which are optional installs, and PyPDF2 ("pypdf2"), which is in requirements.txt and always available.
+# PDF_BACKEND picks one; by default the fastest installed backend is used.
+# With PDF_EXTRACT_WORKERS > 1, long documents are split into page ranges extracted in a process pool,
+# and bulk ingestion extracts upcoming PDFs in the same pool while earlier resumes are being embedded.
+
+MAX_PDF_BYTES = int(env.get("PDF_MAX_BYTES") or 10 * 1024 * 1024)
+# Pages past this are ignored; no real resume is this long, and scanned ones can be very slow to parse
+MAX_PDF_PAGES = int(env.get("PDF_MAX_PAGES") or 30)
+# Documents with fewer pages are extracted in the calling process, where the pool's overhead would dominate
+PARALLEL_MIN_PAGES = 8
+
+class PDFRejected(ValueError):
+    # The PDF itself can't be extracted (too large or unreadable), so trying again won't help
+    pass
+
+def pymupdf_pages(contents: bytes, start: int, stop: int) -> tuple[int, list[str]]:
+    import pymupdf
+    with pymupdf.open(stream=contents, filetype="pdf") as document:
+        return document.page_count, [document[i].get_text() for i in range(start, min(stop, document.page_count))]
+
+def pypdfium2_pages(contents: bytes, start: int, stop: int) -> tuple[int, list[str]]:
+    import pypdfium2
+    document = pypdfium2.PdfDocument(contents)
+    try:
+        texts = []
+        for i in range(start, min(stop, len(document))):
+            page = document[i]
+            text_page = page.get_textpage()
+            texts.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+        return len(document), texts
+    finally:
+        document.close()
+
+def pypdf2_pages(contents: bytes, start: int, stop: int) -> tuple[int, list[str]]:
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(contents))
+    return len(reader.pages), [reader.pages[i].extract_text() for i in range(start, min(stop, len(reader.pages)))]
+
+# Each backend returns the document's page count and the texts of pages [start, stop)
+BACKENDS = {
+    "pymupdf": (pymupdf_pages, "pymupdf"),
+    "pypdfium2": (pypdfium2_pages, "pypdfium2"),
+    "pypdf2": (pypdf2_pages, "PyPDF2"),
+}
+
+def available_backends() -> list[str]:
+    return [name for name, (_, module) in BACKENDS.items() if importlib.util.find_spec(module)]
+
+@Lazy
+def default_backend() -> str:
+    backend = env.get("PDF_BACKEND") or available_backends()[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF_BACKEND {backend!r}, expected one of {list(BACKENDS)}")
+    return backend
+
+@Lazy
+def extraction_workers() -> int:
+    return int(env.get("PDF_EXTRACT_WORKERS") or 0)
+
+@Lazy
+def get_extraction_pool() -> ProcessPoolExecutor | None:
+    if extraction_workers() <= 1:
+        return None
+    return ProcessPoolExecutor(extraction_workers(), mp_context=multiprocessing.get_context("spawn"))
+
+def page_ranges(start: int, stop: int, parts: int) -> list[tuple[int, int]]:
+    size = -(-(stop - start) // parts)
+    return [(i, min(i + size, stop)) for i in range(start, stop, size)]
+
+def iter_page_texts(contents: bytes, backend: str | None = None, parallel: bool = True) -> Iterator[str]:
+    # Yields the text of each page in order, as soon as it is available
+    if len(contents) > MAX_PDF_BYTES:
+        raise PDFRejected(f"PDF is {len(contents)} bytes, more than the limit of {MAX_PDF_BYTES}")
+    extract_pages = BACKENDS[backend or default_backend()][0]
+    pool = get_extraction_pool() if parallel else None
+
+    # The first pages come from this process, which also learns the page count from them
+    try:
+        page_count, texts = extract_pages(contents, 0, PARALLEL_MIN_PAGES if pool else MAX_PDF_PAGES)
+    except ImportError:
+        raise
+    except Exception as e:
+        raise PDFRejected(f"PDF could not be read: {e}") from e
+    yield from texts
+    stop = min(page_count, MAX_PDF_PAGES)
+    if pool is None or len(texts) >= stop:
+        return
+    futures = [pool.submit(extract_pages, contents, start, end) for start, end in page_ranges(len(texts), stop, extraction_workers())]
+    for future in futures:
+        yield from future.result()[1]
+
+def extract_text(contents: bytes, backend: str | None = None, parallel: bool = True) -> str:
+    # Pages are joined with a newline, so the last word of a page doesn't run into the first of the next
+    return "\n".join(iter_page_texts(contents, backend, parallel))
+
+def extract_file_text(path: str, backend: str | None = None) -> str:
+    # Runs in the extraction pool, whose processes extract whole documents without a pool of their own
+    return extract_text(Path(path).read_bytes(), backend, parallel=False)
+
+def extract_files(paths: Iterable[Path], lookahead: int = 16) -> Iterator[tuple[Path, str | None]]:
+    # Yields (path, text) in input order, with the text of PDFs and None for other files. With an
+    # extraction pool, up to lookahead upcoming PDFs are extracted while the consumer works on earlier ones.
+    pool = get_extraction_pool()
+    pending: deque[tuple[Path, Future | None]] = deque()
+    for path in paths:
+        is_pdf = path.suffix.lower() == ".pdf"
+        if pool is None:
+            yield path, extract_text(path.read_bytes()) if is_pdf else None
+            continue
+        pending.append((path, pool.submit(extract_file_text, str(path), default_backend()) if is_pdf else None))
+        if len(pending) >= lookahead:
+            done_path, future = pending.popleft()
+            yield done_path, future.result() if future else None
+    while pending:
+        done_path, future = pending.popleft()
+        yield done_path, future.result() if future else None
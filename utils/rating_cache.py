@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import threading
+import time
+
+from utils.env import env
+from utils.hashing import hash_text, hash_schema
+
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_TTL = 30 * 24 * 60 * 60  # 30 days
+
+class RatingCache:
+    # Persistent cache of LLM resume ratings, keyed by the content of everything that affects a rating.
+    # Entries expire after ttl seconds, and the least recently used entries are evicted past max_entries.
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ratings ("
+            "key TEXT PRIMARY KEY, ratings TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ratings_last_used ON ratings (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(resume: str, schema: dict, model: str, system_message: str) -> str:
+        parts = [hash_text(resume), hash_schema(schema), model, hash_text(system_message)]
+        return hash_text("|".join(parts))
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT key, ratings FROM ratings WHERE key IN ({placeholders}) AND created_at > ?",
+                [*keys, now - self.ttl]
+            ).fetchall()
+            found = {key: json.loads(ratings) for key, ratings in rows}
+            self.conn.executemany("UPDATE ratings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys) - found.keys())
+        return found
+
+    def set_many(self, entries: dict[str, dict]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ratings (key, ratings, created_at, last_used) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(ratings), now, now) for key, ratings in entries.items()]
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def get(self, key: str) -> dict | None:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, ratings: dict) -> None:
+        self.set_many({key: ratings})
+
+    def _evict(self, now: float) -> None:
+        self.conn.execute("DELETE FROM ratings WHERE created_at <= ?", (now - self.ttl,))
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM ratings").fetchone()
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM ratings WHERE key IN (SELECT key FROM ratings ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self) -> dict:
+        with self.lock:
+            (size,) = self.conn.execute("SELECT COUNT(*) FROM ratings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": size,
+        }
+
+rating_cache = RatingCache(
+    env.get("RATING_CACHE_PATH") or "rating_cache.db",
+    max_entries=int(env.get("RATING_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+    ttl=float(env.get("RATING_CACHE_TTL") or DEFAULT_TTL),
+)
@@ -0,0 +1,45 @@
+import time
+from contextvars import ContextVar
+from uuid import uuid4
+
+from utils.metrics import http_request_seconds
+
+# Per-request scratch space, e.g. for memoizing lookups that several dependencies of one request need
+request_memo: ContextVar[dict | None] = ContextVar("request_memo", default=None)
+
+# Id of the current request (or ingestion job), attached to trace spans and outgoing LLM calls
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+class RequestContextMiddleware:
+    # Plain ASGI middleware, so the request context is shared by the whole request (dependencies included).
+    # Reuses the caller's X-Request-ID (or generates one), echoes it in the response and records the request latency.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER)
+        current_id = incoming.decode("latin-1")[:128] if incoming else uuid4().hex
+        memo_token = request_memo.set({})
+        id_token = request_id.set(current_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER, current_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            # Label by route template rather than raw path, so path parameters and unknown paths don't blow up cardinality
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_seconds.observe(time.perf_counter() - start, method=scope["method"], route=route, status=str(status))
+            request_id.reset(id_token)
+            request_memo.reset(memo_token)
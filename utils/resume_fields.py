@@ -0,0 +1,47 @@
+import re
+import time
+
+# Structured fields stored in each resume's Qdrant payload next to its text, so jobs can filter
+# candidates inside the vector search (see candidate_filter in utils/matching.py).
+# Indexed by testing/create_qdrant_collection.py.
+
+# Skills recognised in resume text. Job skill filters match against these (lowercase) names.
+SKILLS = [
+    "python", "java", "javascript", "typescript", "c++", "c#", "golang", "rust", "ruby", "php", "swift", "kotlin", "scala",
+    "sql", "postgresql", "mysql", "mongodb", "redis", "spark", "hadoop", "kafka", "airflow", "dbt", "snowflake",
+    "aws", "azure", "gcp", "docker", "kubernetes", "terraform", "linux", "git", "ci/cd",
+    "react", "angular", "vue", "node.js", "django", "flask", "fastapi", "spring", "graphql", "rest",
+    "machine learning", "deep learning", "nlp", "computer vision", "pytorch", "tensorflow", "scikit-learn",
+    "pandas", "numpy", "statistics", "data analysis", "tableau", "power bi", "excel",
+    "solidworks", "autocad", "catia", "ansys", "matlab", "simulink", "finite element analysis", "cad", "gd&t",
+    "plc", "embedded systems", "pcb design", "verilog", "labview",
+    "project management", "agile", "scrum", "product management", "salesforce", "seo", "marketing", "accounting",
+]
+
+# Word boundaries that also work for names like "c++", "c#" and "node.js"
+SKILL_PATTERNS = {skill: re.compile(rf"(?<![\w+#.]){re.escape(skill)}(?![\w+#])", re.IGNORECASE) for skill in SKILLS}
+YEARS_PATTERN = re.compile(r"(\d{1,2}(?:\.\d)?)\s*\+?\s*(?:years|yrs)", re.IGNORECASE)
+
+def extract_skills(text: str) -> list[str]:
+    return [skill for skill, pattern in SKILL_PATTERNS.items() if pattern.search(text)]
+
+def extract_years_experience(text: str) -> float | None:
+    # The largest "N years" / "N+ yrs" mention, e.g. from a summary line. None if the resume never says.
+    years = [float(match) for match in YEARS_PATTERN.findall(text)]
+    years = [value for value in years if value <= 60]
+    return max(years) if years else None
+
+def normalize_location(value: str | None) -> str | None:
+    # Stored lowercase so keyword filters don't depend on how users capitalised their city
+    return value.strip().lower() if value and value.strip() else None
+
+def resume_payload(text: str, name: str, city: str | None = None, country: str | None = None, uploaded_at: float | None = None) -> dict:
+    return {
+        "resume": text,
+        "name": name,
+        "city": normalize_location(city),
+        "country": normalize_location(country),
+        "uploaded_at": uploaded_at if uploaded_at is not None else time.time(),
+        "skills": extract_skills(text),
+        "years_experience": extract_years_experience(text),
+    }
@@ -0,0 +1,36 @@
+import sqlite3
+import threading
+import time
+
+from utils.env import env
+
+class ResumeIndex:
+    # Local index of the latest ingested resume of every user: fingerprints of the uploaded PDF and of its
+    # normalized text, and a version that goes up whenever the text changes. The same fingerprints and version
+    # are stored in the resume's Qdrant payload, and the version is copied into its stored matches.
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS resumes ("
+            "user_id TEXT PRIMARY KEY, pdf_hash TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def get(self, user_id: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM resumes WHERE user_id = ?", (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def record(self, user_id: str, pdf_hash: str, text_hash: str, version: int) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO resumes (user_id, pdf_hash, text_hash, version, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET pdf_hash = excluded.pdf_hash, text_hash = excluded.text_hash, "
+                "version = excluded.version, updated_at = excluded.updated_at",
+                (user_id, pdf_hash, text_hash, version, time.time())
+            )
+
+resume_index = ResumeIndex(env.get("RESUME_INDEX_PATH") or "resume_index.db")
@@ -0,0 +1,19 @@
+import time
+from contextlib import contextmanager
+
+from utils.tracing import span
+
+@contextmanager
+def timed(timings: dict[str, float] | None, stage: str, **attributes):
+    # Traces the block as a span and adds the seconds spent in it to timings[stage]
+    start = time.perf_counter()
+    try:
+        with span(stage, **attributes):
+            yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def server_timing_header(timings: dict[str, float]) -> str:
+    # Server-Timing header value, so per-stage latency shows up in the browser's network panel
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -0,0 +1,41 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from utils.env import env
+from utils.metrics import stage_seconds
+from utils.request_context import request_id
+
+# Structured timing spans: one JSON log line per span, tagged with the current request id,
+# plus a stage_duration_seconds observation for /metrics.
+
+logger = logging.getLogger("talent_matching.trace")
+
+def configure_logging() -> None:
+    # Spans are logged at INFO; set LOG_LEVEL=WARNING to silence them
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    root = logging.getLogger("talent_matching")
+    root.addHandler(handler)
+    root.setLevel(env.get("LOG_LEVEL") or "INFO")
+    root.propagate = False
+
+def record_span(name: str, seconds: float, **attributes) -> None:
+    # For durations measured elsewhere, e.g. queue waits
+    stage_seconds.observe(seconds, stage=name)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"span": name, "request_id": request_id.get(), "duration_ms": round(seconds * 1000, 2)} | attributes, default=str))
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    # Yields the span's attributes, so the block can add to them (token counts, retries, sizes, ...)
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start, **attributes)
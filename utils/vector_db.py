@@ -0,0 +1,71 @@
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
+
+from utils.env import env
+from utils.lazy import Lazy
+
+# Clients are created on first use rather than at import. QDRANT_URL=":memory:" gives an in-memory instance
+# (per client, so the sync and async clients don't share data).
+
+@Lazy
+def get_vector_client() -> QdrantClient:
+    return QdrantClient(location=env["QDRANT_URL"], api_key=env.get("QDRANT_API_KEY"))
+
+@Lazy
+def get_async_vector_client() -> AsyncQdrantClient:
+    return AsyncQdrantClient(location=env["QDRANT_URL"], api_key=env.get("QDRANT_API_KEY"))
+
+# Payload indexes for the structured fields jobs filter on (see utils/resume_fields.py), so filtered
+# searches stay fast and Qdrant can plan them, instead of checking every candidate's payload
+PAYLOAD_INDEXES = {
+    "city": models.PayloadSchemaType.KEYWORD,
+    "country": models.PayloadSchemaType.KEYWORD,
+    "skills": models.PayloadSchemaType.KEYWORD,
+    "years_experience": models.PayloadSchemaType.FLOAT,
+    "uploaded_at": models.PayloadSchemaType.FLOAT,
+}
+
+def quantization_config(quantization: str, always_ram: bool = True) -> models.QuantizationConfig | None:
+    # "scalar" stores each dimension as an int8 (4x smaller), "binary" as a single bit (32x smaller, and only
+    # accurate enough for high-dimensional embeddings like Jina's when searches oversample and rescore).
+    # always_ram keeps the quantized vectors in RAM while the originals can live on disk.
+    if quantization == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=always_ram))
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    if quantization == "none":
+        return None
+    raise ValueError(f"Unknown quantization {quantization!r}")
+
+def collection_config(
+    dim: int = 768,
+    quantization: str = "none",
+    on_disk: bool = False,
+    hnsw_m: int = 16,
+    hnsw_ef_construct: int = 100,
+    always_ram: bool = True,
+) -> dict:
+    # create_collection arguments for a resume collection: Jina dense vectors and BM42 sparse vectors.
+    # on_disk memory-maps the original vectors (and the HNSW graph), leaving only the quantized vectors in RAM,
+    # which is what lets a million-resume pool fit on a modest node.
+    return {
+        "vectors_config": {
+            "jina": models.VectorParams(size=dim, distance=models.Distance.COSINE, on_disk=on_disk)
+        },
+        "sparse_vectors_config": {
+            "bm42": models.SparseVectorParams(modifier=models.Modifier.IDF, index=models.SparseIndexParams(on_disk=on_disk))
+        },
+        "hnsw_config": models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct, on_disk=on_disk),
+        "quantization_config": quantization_config(quantization, always_ram),
+    }
+
+def estimated_ram_bytes(points: int, dim: int = 768, quantization: str = "none", on_disk: bool = False, hnsw_m: int = 16, always_ram: bool = True) -> int:
+    # Rough RAM needed for a collection's dense vectors and HNSW graph, following Qdrant's capacity planning
+    # guidance. Payloads, sparse vectors and the page cache of on-disk data come on top.
+    quantized = {"none": 0, "scalar": dim, "binary": (dim + 7) // 8}[quantization]
+    per_point = 0 if on_disk else dim * 4
+    if quantized and (always_ram or not on_disk):
+        per_point += quantized
+    # Level 0 of the graph holds up to 2 * m neighbour ids of 4 bytes per point
+    if not on_disk:
+        per_point += 2 * hnsw_m * 4
+    return int(points * per_point * 1.5)
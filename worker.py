@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Callable
+from qdrant_client import models
+from qdrant_client.models import PointStruct
+
+from utils.chunking import CHUNK_COLLECTION, build_chunk_points, chunks_enabled, replace_chunks
+from utils.embedding import build_qdrant_vector, warm_up
+from utils.hashing import hash_bytes, text_fingerprint
+from utils.incremental_matching import update_matches_for_resume
+from utils.ingest_queue import ingest_queue
+from utils.match_store import match_repository
+from utils.pdf import PDFRejected, extract_text
+from utils.resume_fields import resume_payload
+from utils.resume_index import resume_index
+from utils.request_context import request_id
+from utils.tracing import configure_logging, record_span
+from utils.vector_db import get_vector_client
+
+# Resume ingestion worker, e.g.:
+# python worker.py --workers 4
+# Each worker process claims queued uploads and runs extraction, embedding and upsert,
+# so ingestion throughput scales with the number of workers rather than with API workers.
+
+# Errors that would recur on every attempt, i.e. a rejected PDF or a missing upload, fail the job without retries
+PERMANENT_ERRORS = (PDFRejected, FileNotFoundError)
+
+def run_stage(job_id: str, stage: str, fn: Callable, *args):
+    # Each stage renews the job's heartbeat, so a long job isn't mistaken for a dead worker's and claimed again
+    ingest_queue.heartbeat(job_id)
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    ingest_queue.record_stage(job_id, stage, seconds)
+    record_span(f"ingest_{stage}", seconds)
+    return result
+
+def process_job(job: dict, loop: asyncio.AbstractEventLoop) -> None:
+    job_id = job["job_id"]
+    # The ingestion job id doubles as the request id of everything this job traces
+    request_id.set(job_id)
+    record_span("ingest_queue_wait", job["timings"].get("queue_wait", 0.0))
+    user_id = job["user_id"]
+    contents = run_stage(job_id, "read", Path(job["path"]).read_bytes)
+
+    # Identical re-uploads stop here, before extraction and embedding. A different PDF with the same
+    # normalized text (e.g. exported again) stops after extraction. Either way the job ends in stage "unchanged".
+    pdf_hash = hash_bytes(contents)
+    indexed = resume_index.get(user_id)
+    if indexed and indexed["pdf_hash"] == pdf_hash:
+        ingest_queue.record_stage(job_id, "unchanged", 0.0)
+        return
+    text_content = run_stage(job_id, "extract", extract_text, contents)
+    text_hash = text_fingerprint(text_content)
+    if indexed and indexed["text_hash"] == text_hash:
+        # The stored points keep their vectors and version, but carry the new PDF's fingerprint like the index does
+        run_stage(job_id, "payload", get_vector_client().set_payload, "talent-pool", {"pdf_hash": pdf_hash}, [user_id])
+        if chunks_enabled():
+            chunk_filter = models.Filter(must=[models.FieldCondition(key="candidate_id", match=models.MatchValue(value=user_id))])
+            run_stage(job_id, "chunk_payload", get_vector_client().set_payload, CHUNK_COLLECTION, {"pdf_hash": pdf_hash}, chunk_filter)
+        resume_index.record(user_id, pdf_hash, text_hash, indexed["version"])
+        ingest_queue.record_stage(job_id, "unchanged", 0.0)
+        return
+    version = indexed["version"] + 1 if indexed else 1
+
+    # Create two embeddings for the resume:
+    # BM42: good balance of keyword matching and semantic meaning
+    # Jina: good at semantic meaning, but not as good at keyword matching
+    vec = run_stage(job_id, "embed", build_qdrant_vector, text_content)
+
+    # Insert resume into vector database, with the structured fields jobs can filter on
+    payload = resume_payload(text_content, job["name"], **job["metadata"]) | {"pdf_hash": pdf_hash, "text_hash": text_hash, "resume_version": version}
+    point = PointStruct(id=user_id, vector=vec, payload=payload)
+    run_stage(job_id, "upsert", get_vector_client().upsert, "talent-pool", [point])
+
+    # Section chunks, for jobs that retrieve by chunk
+    if chunks_enabled():
+        chunk_points = run_stage(job_id, "chunk_embed", build_chunk_points, [payload | {"id": user_id}])
+        run_stage(job_id, "chunk_upsert", replace_chunks, get_vector_client(), chunk_points)
+
+    # Merge the new resume into the stored matches of the jobs it now qualifies for.
+    # The resume is already searchable, so a failure here doesn't fail the upload.
+    try:
+        updated_jobs = run_stage(job_id, "match", loop.run_until_complete, update_matches_for_resume(payload | {"id": user_id}))
+        print(f"Updated matches for {len(updated_jobs)} jobs after ingestion job {job_id}")
+    except Exception as e:
+        print(f"Error updating matches after ingestion job {job_id}: {e}")
+
+    # The jobs above now hold ratings of this version. Any other stored match of the candidate was rated from
+    # an older version of the resume, so only those rows are dropped; the jobs re-rate them on their next refresh.
+    run_stage(job_id, "invalidate", match_repository.delete_outdated_resume, user_id, version)
+    # Recorded last, so a job that fails before this point is retried in full
+    resume_index.record(user_id, pdf_hash, text_hash, version)
+
+def run_worker(poll_interval: float) -> None:
+    configure_logging()
+    # Load the models before claiming work, so the first job's embed stage isn't inflated by it
+    warm_up()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    # One event loop for the worker's lifetime, so the shared async clients keep their connection pools
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    while True:
+        job = ingest_queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        try:
+            process_job(job, loop)
+        except Exception as e:
+            print(f"Error processing ingestion job {job['job_id']}: {e}")
+            # The upload is kept while the job may still be retried
+            if ingest_queue.fail(job["job_id"], str(e), retry=not isinstance(e, PERMANENT_ERRORS)):
+                Path(job["path"]).unlink(missing_ok=True)
+            continue
+        ingest_queue.complete(job["job_id"])
+        # The raw PDF is only needed until the resume is in the vector database
+        Path(job["path"]).unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run resume ingestion workers")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    # Spawned rather than forked, so every worker opens its own queue connection and models
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(args.poll_interval,)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()